@@ -1,13 +1,181 @@
 #!/usr/bin/python3.9
 import matplotlib.pyplot as plt
 import networkx as nx
+import numpy as np
 import subprocess
 import json
+import argparse
+import asyncio
+import bisect
+import ctypes
+import ctypes.util
+import csv
+import difflib
+import hashlib
+import mmap
+import sys
+import multiprocessing
+import os
+import resource
+import select
+import shlex
+import signal
+import sqlite3
+import struct
+import tempfile
+import time
+import tracemalloc
+from array import array
+from itertools import islice
 from pprint import pp
+from xml.sax.saxutils import escape, quoteattr
+
+# Optional, faster decoders for the clang JSON dump
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+# Optional, for the libclang frontend
+try:
+    import clang.cindex
+except ImportError:
+    clang = None
 
 srcFilename = "./example.cc"
 varToTrace = "X"
 
+# Facts extracted from the AST. Subtrees of kinds that can't contribute to
+# any of these are skipped during ingestion (see isRelevantKind()).
+extractedFacts = {"assignments", "calls", "declarations", "instrumentation"}
+
+# Only build the children of a node once a pass touches them. climbAST() then
+# builds the bodies of functionsToAnalyze, or of the functions in srcFilename
+# when that's None, and leaves every other body as the raw dict.
+lazyChildren = False
+functionsToAnalyze = None
+
+# Decoder for the clang JSON dump: "orjson", "simdjson" (on-demand, only the
+# fields the node classes read get decoded), "json" or "auto" for the fastest
+# one that's installed
+jsonBackend = "auto"
+
+# "json" round-trips the AST through clang's JSON dump, "libclang" walks the
+# cursors of the translation unit directly through clang.cindex
+frontend = "json"
+
+# Extra arguments for clang, used by both frontends
+clangArgs = []
+
+# Files whose assignments and calls go into the dependency graph, only
+# srcFilename when empty
+analyzedFiles = []
+
+# Slots in the address set of the runtime injected by instrumentCode(), a
+# power of two. Can still be overridden with -D__AST_CLIMBER_CAPACITY=...
+runtimeCapacity = 1 << 16
+
+instFilename = "example_inst.cc"
+
+# SQLite database keeping the facts of every translation unit analyzed into
+# it (see FactDatabase), None to trace within the one in memory. The cache
+# is what bounds its memory use.
+databaseFilename = None
+databaseCacheKiB = 64 * 1024
+
+# Worker processes building the function bodies of the translation unit, the
+# top-level declarations are split into shards between them (see
+# climbASTSharded()). 1 builds everything in this process.
+shardWorkers = 1
+
+# Summarize what flows out of the parameters of every function with a body
+# and stitch calls from the summaries (see FunctionSummary), on top of the
+# argument to parameter edges, which the copies in the callees' bodies still
+# need. Summaries are kept in summaryCacheFilename by function content, when
+# it's set, the bodies are still built every run.
+functionSummaries = False
+summaryCacheFilename = None
+
+# How the copies of varToTrace are found: "directed" follows the flows from
+# it, "unify" merges both ends of every flow into one alias set (AliasSets)
+aliasMode = "directed"
+
+# Where the findings are streamed to while the analysis runs (see
+# FindingsWriter), if anywhere
+findings = None
+
+# Translation units that can wait between two stages of the pipeline
+# several --src go through (see runPipeline())
+pipelineDepth = 2
+
+# Limits for one translation unit: seconds clang may take to dump it and
+# how often that's retried, MiB clang may use and the decoded dump may be
+# expected to take, about dumpMemoryFactor times its size in Python objects
+clangTimeout = None
+dumpRetries = 1
+memoryLimit = None
+dumpMemoryFactor = 8
+
+# Scheduling guesses for translation units without a run in historyFilename
+historyFilename = None
+estimatedSecondsPerByte = 2e-6
+estimatedSecondsPerInclude = 0.02
+
+# Declaration facts of headers kept by content across translation units and
+# runs (see HeaderCache), when it's set
+headerCacheFilename = None
+
+# Precompiled header of the include lines the sources start with, built and
+# reused by preparePch() when they only bring in system headers. pchInUse is
+# set once it's been checked to declare the same as the headers themselves.
+pchFilename = None
+pchInUse = None
+
+# What instrumentCode() writes for a source: the instrumented "file", a
+# unified "diff" against the source or the "edits" as (byte offset, text). Files
+# that already have the content are left alone.
+outputMode = "file"
+
+# Bundles of the translation units of a compile_commands.json split into
+# shardCount shards, each run on its own by shard-run and merged afterwards
+# (see runShard() and mergeBundles()). Nodes only share this directory.
+bundleDirectory = None
+shardCount = 1
+
+# Where the dependency graph is written edge by edge as it's found (see
+# GraphExport), as "csv", "npy" or "graphml", by the extension if not given
+graphExportFilename = None
+graphExportFormat = None
+
+# Image the dependency graph is drawn into, only when it's set. With
+# neighborhoodHops, just the nodes that many flows away from
+# neighborhoodCenter, the traced variable unless it names a variable or
+# "free:<line>" for what's passed to a free() there. Graphs past
+# drawNodeLimit aren't drawn, spring_layout() needs scipy for them and they
+# can't be read anyway.
+drawFilename = None
+neighborhoodHops = None
+neighborhoodCenter = None
+drawNodeLimit = 500
+
+# Corpus the regress command checks the engines against: cases.json names
+# the sources, the engine settings and the budgets of each phase, golden/
+# holds the copies and instrumented output every engine has to reproduce
+regressionDirectory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regression")
+
+# Quiet time after a change before watch mode re-instruments, and how often
+# the files are polled where inotify isn't available
+watchDebounce = 0.05
+watchPollInterval = 0.2
+
+# Drop __AddAddress() calls that an identical earlier call already covers and
+# move loop-invariant ones in front of their loop (see optimizeInstrumentation())
+elideInstrumentation = True
+
 class Variable:
     allVars = {}
     varToTraceId = None
@@ -68,15 +236,179 @@ class FunctionCall:
         self.params = params
         FunctionCall.allFuncCalls[self.id] = (self.calledFuncId, [p.id if p is not None else None for p in self.params])
 
+class FunctionSummary:
+    # Where each parameter of a function flows to within it and the
+    # functions it calls: the other parameters, the globals, the return
+    # value, and whether it reaches a memcpy() or a free(). A call result
+    # is the variable with the id of the CallExpr.
+    allSummaries = {}
+    byNameAndArity = {}
+    cache = {}
+
+    def __init__(self, functionId, name, params, returns, globals, memcpy, free, key=None):
+        self.functionId = functionId
+        self.name = name
+        self.params = params
+        self.returns = returns
+        self.globals = globals
+        self.memcpy = memcpy
+        self.free = free
+        self.key = key
+        FunctionSummary.allSummaries[functionId] = self
+        FunctionSummary.byNameAndArity[(name, len(params))] = self
+
+    @staticmethod
+    def forCall(calleeId, argCount):
+        # Calls mostly name a prototype, the summary is of the definition
+        if calleeId in FunctionSummary.allSummaries:
+            return FunctionSummary.allSummaries[calleeId]
+        if calleeId not in FunctionDeclaration.allFuncDeclByName:
+            return None
+        return FunctionSummary.byNameAndArity.get((FunctionDeclaration.allFuncDeclByName[calleeId][0], argCount))
+
+    def toJson(self, globalsAsNames=False):
+        globals = [[Variable.allVars.get(g) for g in reached] for reached in self.globals] if globalsAsNames else self.globals
+        return {"function": self.functionId, "name": self.name, "params": self.params, "returns": self.returns, "globals": globals, "memcpy": self.memcpy, "free": self.free}
+
+    @staticmethod
+    def fromJson(summary, functionId=None, globalIds=None, key=None):
+        globals = [[globalIds[g] for g in reached if g in globalIds] for reached in summary["globals"]] if globalIds is not None else summary["globals"]
+        return FunctionSummary(functionId or summary["function"], summary["name"], summary["params"], summary["returns"], globals, summary["memcpy"], summary["free"], key)
+
+class HeaderCache:
+    # The function declarations in the top-level declarations starting in
+    # each header, by its path, its content and the macros that can change
+    # what it declares. Top-level declarations starting in a header with an
+    # entry aren't built, their declarations are registered straight from the
+    # dump (see registerHeaderDeclarations()). Function bodies in those
+    # headers are left out with them.
+    entries = {}
+    loaded = None
+    keys = {}
+    found = {}
+    built = {}
+
+    @staticmethod
+    def load():
+        if HeaderCache.loaded != headerCacheFilename:
+            HeaderCache.loaded = headerCacheFilename
+            if os.path.exists(headerCacheFilename):
+                with open(headerCacheFilename) as cacheFile:
+                    HeaderCache.entries = json.load(cacheFile)
+
+    @staticmethod
+    def save():
+        with open(headerCacheFilename, "w") as cacheFile:
+            json.dump(HeaderCache.entries, cacheFile)
+
+    @staticmethod
+    def macroState():
+        # Defines on the command line and in srcFilename, which is where the
+        # ones in effect before a header is included come from
+        state = [arg for i, arg in enumerate(clangArgs) if arg.startswith(("-D", "-U", "-include")) or i > 0 and clangArgs[i - 1] == "-include"]
+        try:
+            with open(srcFilename, "rb") as sourceFile:
+                state += [line.strip().decode(errors="replace") for line in sourceFile if line.lstrip().startswith((b"#define", b"#undef"))]
+        except OSError:
+            pass
+        return "\n".join(state)
+
+    @staticmethod
+    def key(file):
+        if file not in HeaderCache.keys:
+            key = None
+            if file is not None and file != srcFilename and file not in analyzedFiles:
+                try:
+                    with open(file, "rb") as headerFile:
+                        content = hashlib.sha1(headerFile.read()).hexdigest()
+                    if "" not in HeaderCache.keys:
+                        HeaderCache.keys[""] = HeaderCache.macroState()
+                    key = hashlib.sha1((os.path.abspath(file) + "\0" + content + "\0" + HeaderCache.keys[""]).encode()).hexdigest()
+                except OSError:
+                    pass
+            HeaderCache.keys[file] = key
+        return HeaderCache.keys[file]
+
+    @staticmethod
+    def startFile(data):
+        return data["loc"]["file"] if "loc" in data and "file" in data["loc"] else AstNode.currentFile
+
+    @staticmethod
+    def cached(file):
+        key = HeaderCache.key(file)
+        return key is not None and key in HeaderCache.entries
+
+    @staticmethod
+    def check():
+        # The declarations registered from the dump have to be the ones the
+        # entry says the header has. Entries that don't match are dropped,
+        # the names of their headers returned.
+        stale = []
+        for file, functions in HeaderCache.found.items():
+            key = HeaderCache.key(file)
+            if HeaderCache.entries.get(key) != functions:
+                HeaderCache.entries.pop(key, None)
+                stale.append(file)
+        return stale
+
+    @staticmethod
+    def record():
+        # Entries for the headers this translation unit built
+        for file, functions in HeaderCache.built.items():
+            key = HeaderCache.key(file)
+            if key is not None and key not in HeaderCache.entries:
+                HeaderCache.entries[key] = functions
+
+def registerHeaderDeclarations(data, header):
+    # Registers the function declarations in a top-level declaration starting
+    # in a cached header without building it, following the files the way
+    # ingestion would
+    found = HeaderCache.found.setdefault(header, [])
+    stack = [data]
+    while len(stack) > 0:
+        node = stack.pop()
+        if not isRelevantKind(node["kind"]):
+            followFiles(node)
+            continue
+        if "loc" in node and "file" in node["loc"]:
+            AstNode.currentFile = node["loc"]["file"]
+            AstNode.currentFileIndex = fileIndexFor(AstNode.currentFile)
+        if "id" in node:
+            AstNode.nodeFileIndexes.setdefault(node["id"], AstNode.currentFileIndex)
+        children = [child for child in node["inner"] if len(child) > 0] if "inner" in node else []
+        if node["kind"] == "FunctionDecl":
+            params = [Variable(child["id"], child.get("name")) for child in children if child["kind"] == "ParmVarDecl"]
+            FunctionDeclaration(node["id"], node.get("name"), params)
+            found.append([node.get("name"), [param.name for param in params]])
+        stack.extend(reversed(children))
+
 class AstNode:
     allNodes = {}
     currentFile = None
+    currentFileIndex = None
     firstSrcFileNode = None
 
+    # Every file seen during ingestion gets an index, nodes are attributed
+    # to the index of their file once, when they're built
+    fileIndexes = {}
+    fileNames = []
+    nodeFileIndexes = {}
+
+    # With sharded ingestion (see climbASTSharded()) facts come back from the
+    # workers without their nodes. Top-level declarations are known by their
+    # position in the "inner" of shardRoot: the one each fact id was found
+    # in, the file each starts from and the ones built here since.
+    shardRoot = None
+    shardOwners = {}
+    shardStartFiles = {}
+    shardFirstSrcFilePosition = None
+    shardBuilt = set()
+
     def __init__(self, root, parent):
         self.root = root
         self.id = self.getField("id")
-        if self.id is not None and self.id not in AstNode.allNodes:
+        isNewId = self.id is not None and self.id not in AstNode.allNodes
+        if isNewId:
             AstNode.allNodes[self.id] = self
         self.parent = parent
         self.file = None
@@ -85,13 +417,20 @@ class AstNode:
             self.file = self.loc.getField("file")
         if self.file is None:
             self.file = AstNode.currentFile
+            self.fileIndex = AstNode.currentFileIndex
         else:
             AstNode.currentFile = self.file
-            if self.file == srcFilename and AstNode.firstSrcFileNode is None:
-                AstNode.firstSrcFileNode = self
+            AstNode.currentFileIndex = fileIndexFor(self.file)
+            self.fileIndex = AstNode.currentFileIndex
+        # The declaration naming the file may have been skipped, so the first
+        # node in it can be one carrying the file over
+        if self.file == srcFilename and AstNode.firstSrcFileNode is None and "kind" in root:
+            AstNode.firstSrcFileNode = self
+        if isNewId:
+            AstNode.nodeFileIndexes[self.id] = self.fileIndex
 
         self.kind = self.getField("kind")
-        self.inner = []
+        self._inner = None
         self.variables = None
         self.parameters = None
         self.arguments = None
@@ -101,28 +440,70 @@ class AstNode:
         self.parentFlowControlNode = None
 
         self.range = self.objectFromField(RangeField, "range")
-        self.instrumentationLocations = None
-        self.analyzeChildren()
+        self.insertionPoints = None
+        if not lazyChildren:
+            self.analyzeChildren()
+
+    @property
+    def inner(self):
+        if self._inner is None:
+            self.analyzeChildren()
+        return self._inner
 
     def getField(self, field):
         return self.root[field] if field in self.root else None
 
     def objectFromField(self, obj, field):
-        return obj(self.root[field], self) if field in self.root else None
+        if field not in self.root or not isRelevantKind(obj.__name__):
+            return None
+        return obj(self.root[field], self)
 
     def analyzeChildren(self):
+        self._inner = []
         if "inner" in self.root:
+            # Children built lazily still have to start from the file this
+            # node was attributed to, not from wherever ingestion left off
+            AstNode.currentFile = self.file
+            AstNode.currentFileIndex = self.fileIndex
             for childNode in self.root["inner"]:
                 if len(childNode) == 0:
                     continue
-                self.inner.append(nodeKindMap[childNode["kind"]](childNode, self))
+                kind = childNode["kind"]
+                if not isRelevantKind(kind):
+                    followFiles(childNode)
+                    continue
+                if self.parent is None and headerCacheFilename is not None:
+                    header = HeaderCache.startFile(childNode)
+                    if HeaderCache.cached(header):
+                        registerHeaderDeclarations(childNode, header)
+                        continue
+                    declared = len(FunctionDeclaration.allFuncDeclByName)
+                    self._inner.append(nodeClassForKind(kind)(childNode, self))
+                    HeaderCache.built.setdefault(header, []).extend([name, params] for name, params in islice(FunctionDeclaration.allFuncDeclByName.values(), declared, None))
+                    continue
+                self._inner.append(nodeClassForKind(kind)(childNode, self))
+
+    def materialize(self):
+        # Build the whole subtree in the order eager ingestion would have,
+        # declarations have to be registered before anything referencing them
+        global lazyChildren
+        if self._inner is None:
+            lazy = lazyChildren
+            lazyChildren = False
+            try:
+                self.analyzeChildren()
+            finally:
+                lazyChildren = lazy
+        else:
+            for child in self._inner:
+                child.materialize()
 
     def checkAttributeCoverage(self):
         # For debugging... can pick out if we've missed any attributes
         # in the AST for any particular node.
-        attributes = self.__dict__.keys()
+        attributes = self.__dict__.keys() | {"inner"}
         supplied   = self.root.keys()
-        diff = supplied - attributes
+        diff = [s for s in supplied if s not in attributes]
         if len(diff) != 0:
             print("Found unexpected parameters in the AST for nodes of kind " + str(self.kind) + ":")
             for d in diff:
@@ -175,13 +556,12 @@ class AstNode:
             return (None, None)
 
     def findInstrumentationLocations(self, instBeginning, instEnding):
-        if self.instrumentationLocations is None:
-            self.instrumentationLocations = []
-            if self.parentFlowControlNode is not None:
-                self.instrumentationLocations.extend(self.parentFlowControlNode.findInstrumentationLocations(instBeginning, instEnding))
-            elif self.range is not None:
-                self.instrumentationLocations.extend(self.range.findInstrumentationLocations(instBeginning, instEnding))
-        return self.instrumentationLocations
+        # Statements within the condition of a flow-control statement get
+        # instrumented around the whole statement instead
+        if self.parentFlowControlNode is not None:
+            return self.parentFlowControlNode.findInstrumentationLocations(instBeginning, instEnding)
+        points = InsertionPoints.of(self)
+        return (points.before if instBeginning else []) + (points.after if instEnding else [])
 
     def assignFlowControlNode(self, node):
         self.parentFlowControlNode = node
@@ -210,13 +590,6 @@ class BeginField(AstNode):
         self.line = self.getField("line")
         self.checkAttributeCoverage()
 
-    def findInstrumentationLocations(self, instBeginning, instEnding):
-        if self.instrumentationLocations is None:
-            self.instrumentationLocations = []
-            if self.offset is not None:
-                self.instrumentationLocations.extend([self.offset])
-        return self.instrumentationLocations
-
 class CopyAssignField(AstNode):
     def __init__(self, root, parent):
         super().__init__(root, parent)
@@ -291,13 +664,6 @@ class EndField(AstNode):
         self.expansionLoc = self.objectFromField(ExpansionLocField, "expansionLoc")
         self.checkAttributeCoverage()
 
-    def findInstrumentationLocations(self, instBeginning, instEnding):
-        if self.instrumentationLocations is None:
-            self.instrumentationLocations = []
-            if self.offset is not None and self.tokLen is not None:
-                self.instrumentationLocations.extend([self.offset + self.tokLen])
-        return self.instrumentationLocations
-
 class ExpansionLocField(AstNode):
     def __init__(self, root, parent):
         super().__init__(root, parent)
@@ -365,15 +731,6 @@ class RangeField(AstNode):
         self.end = self.objectFromField(EndField, "end")
         self.checkAttributeCoverage()
 
-    def findInstrumentationLocations(self, instBeginning, instEnding):
-        if self.instrumentationLocations is None:
-            self.instrumentationLocations = []
-            if instBeginning and self.begin is not None:
-                self.instrumentationLocations.extend(self.begin.findInstrumentationLocations(instBeginning, instEnding))
-            if instEnding and self.end is not None:
-                self.instrumentationLocations.extend(self.end.findInstrumentationLocations(instBeginning, instEnding))
-        return self.instrumentationLocations
-
 class SpellingLocField(AstNode):
     def __init__(self, root, parent):
         super().__init__(root, parent)
@@ -491,7 +848,10 @@ class CallExprNode(AstNode):
             self.functionCall = FunctionCall(self.id, self.calledFuncId, self.arguments)
         
     def findVariables(self):
-        ## TODO Can a data dependency by established with the return value?
+        # With summaries the result of a call is a variable of its own, the
+        # parameters reaching it are stitched in by dependencyEdges()
+        if functionSummaries and self.calledFuncId is not None:
+            return [Variable(self.id, str(self.calledFuncName) + "()")]
         return [None]
     
     def findCalledFunc(self):
@@ -527,18 +887,6 @@ class CompoundStmtNode(AstNode):
         super().__init__(root, parent)
         self.range = self.objectFromField(RangeField, "range")
         self.checkAttributeCoverage()
-    def findInstrumentationLocations(self, instBeginning, instEnding):
-        # We have to instrument the "beginning" of a CompoundStmt by
-        # using the space just before the block's first statement.
-        # Otherwise the beginning is directly behind the left curly-brace
-        if self.instrumentationLocations is None:
-            self.instrumentationLocations = []
-            if instBeginning:
-                if len(self.inner) > 0:
-                    self.instrumentationLocations.extend(self.inner[0].findInstrumentationLocations(True, False))
-            if instEnding:
-                self.instrumentationLocations.extend(self.range.findInstrumentationLocations(False, True))
-        return self.instrumentationLocations
 
 class ConditionalOperatorNode(AstNode):
     def __init__(self, root, parent):
@@ -686,6 +1034,11 @@ class DeclRefExprNode(AstNode):
 
     def findCalledFunc(self):
         if self.referencedDecl.kind == "FunctionDecl":
+            if pchInUse is not None and self.referencedDecl.id not in FunctionDeclaration.allFuncDeclarations:
+                # Declared by a system header in the precompiled header,
+                # which the dump leaves out, all that's known of it is its
+                # name
+                FunctionDeclaration(self.referencedDecl.id, self.referencedDecl.name, [])
             return (self.referencedDecl.id, self.referencedDecl.name)
         else:
             return (None, None)
@@ -824,32 +1177,6 @@ class IfStmtNode(AstNode):
             for child in self.inner:
                 if child.kind != "CompoundStmt":
                     child.assignFlowControlNode(node)
-
-    def findInstrumentationLocations(self, instBeginning, instEnding):
-        # Instrumenting the "ending" of an if-statement means instrumenting
-        # the beginning of the compound statements of the if- and else-blocks
-        # (or just outside of the if-block if there's no else-block)
-        #
-        # Instrumenting the "beginning" is "just before the if-statement",
-        # which is identical to how it'd be handled normally
-        if self.instrumentationLocations is None:
-            self.instrumentationLocations = []
-            if instBeginning:
-                if self.range is not None:
-                    self.instrumentationLocations.extend(self.range.findInstrumentationLocations(True, False))
-            if instEnding:
-                if self.hasElse is not None:
-                    # There's an else block, so instrument both sides
-                    for child in self.inner:
-                        if child.kind == "CompoundStmt":
-                            self.instrumentationLocations.extend(child.findInstrumentationLocations(True, False))
-                else:
-                    # No else block instrument the inside and outside of the block
-                    for child in self.inner:
-                        if child.kind == "CompoundStmt":
-                            self.instrumentationLocations.extend(child.findInstrumentationLocations(True, True))
-
-        return self.instrumentationLocations
         
 class ImplicitCastExprNode(AstNode):
     def __init__(self, root, parent):
@@ -1134,6 +1461,15 @@ class WhileStmtNode(AstNode):
         self.range = self.objectFromField(RangeField, "range")  
         self.checkAttributeCoverage()
 
+class GenericNode(AstNode):
+    # Stand-in for kinds that aren't in nodeKindMap. Only the fields common to
+    # every node are read, children are still analyzed as usual.
+    unknownKinds = set()
+
+    def __init__(self, root, parent):
+        super().__init__(root, parent)
+        GenericNode.unknownKinds.add(self.kind)
+
 nodeKindMap = {
     "AbiTagAttr"               : AbiTagAttrNode,
     "ArraySubscriptExpr"       : ArraySubscriptExprNode,
@@ -1206,35 +1542,1263 @@ nodeKindMap = {
     "WhileStmt"                : WhileStmtNode
 }
 
+allFacts = {"assignments", "calls", "declarations", "instrumentation"}
+
+# The facts each kind of node (or field object, by class name) can contribute
+# to. Kinds that aren't listed are assumed to contribute to all of them, on
+# top of that attribute, type and comment kinds never contribute to any.
+kindFacts = {
+    "CompoundStmt"        : {"assignments", "calls", "instrumentation"},
+    "DefinitionDataField" : set(),
+    "TypeAliasDecl"       : set(),
+    "TypedefDecl"         : set(),
+    "UsingDecl"           : set(),
+    "UsingShadowDecl"     : set()
+}
+
+relevantKindMask = {}
+
+def factsForKind(kind):
+    if kind.endswith("Attr") or kind.endswith("Type") or kind.endswith("Comment"):
+        return set()
+    return kindFacts.get(kind, allFacts)
+
+def isRelevantKind(kind):
+    relevant = relevantKindMask.get(kind)
+    if relevant is None:
+        relevant = not factsForKind(kind).isdisjoint(extractedFacts)
+        relevantKindMask[kind] = relevant
+    return relevant
+
+def setExtractedFacts(facts):
+    global extractedFacts
+    extractedFacts = set(facts)
+    relevantKindMask.clear()
+
+def nodeClassForKind(kind):
+    return nodeKindMap.get(kind, GenericNode)
+
+def materializeFunctions(node, names=None):
+    # Build the bodies of the functions called one of names (or of all the
+    # functions in srcFilename), without touching any other function body
+    stack = [node]
+    while len(stack) > 0:
+        node = stack.pop()
+        if node.kind == "FunctionDecl":
+            if node.name in names if names is not None else node.file == srcFilename:
+                node.materialize()
+        else:
+            stack.extend(reversed(node.inner))
+
+def functionBodies(node):
+    # The function definitions under node, and the global variables outside
+    # of them by name
+    functions = []
+    globalIds = {}
+    stack = [node]
+    while len(stack) > 0:
+        node = stack.pop()
+        if node.kind == "FunctionDecl":
+            if any(child.kind == "CompoundStmt" for child in node.inner):
+                functions.append(node)
+        elif node.kind == "VarDecl":
+            globalIds[node.name] = node.id
+        else:
+            stack.extend(reversed(node.inner))
+    return functions, globalIds
+
+def callGraph(functions):
+    # From every function to the ones with a body it calls
+    byName = {(f.name, len(FunctionDeclaration.allFuncDeclarations[f.id])): f for f in functions}
+    graph = nx.DiGraph()
+    for function in functions:
+        graph.add_node(function.id)
+        for calleeId, args, _ in functionCalls(function):
+            callee = byName.get((FunctionDeclaration.allFuncDeclByName.get(calleeId, (None,))[0], len(args)))
+            if callee is not None:
+                graph.add_edge(function.id, callee.id)
+    return graph
+
+def summarizeFunctions(roots):
+    # The strongly connected components of the call graph, callees before
+    # their callers, so a summary can build on the ones of the functions it
+    # calls. Recursive components are solved together (see
+    # summarizeRecursive()).
+    functions = []
+    globalIds = {}
+    for root in roots:
+        rootFunctions, rootGlobals = functionBodies(root)
+        functions += rootFunctions
+        globalIds.update(rootGlobals)
+    byId = {f.id: f for f in functions}
+    position = {f.id: i for i, f in enumerate(functions)}
+    sources = {}
+
+    graph = callGraph(functions)
+    components = nx.condensation(graph)
+    for component in reversed(list(nx.topological_sort(components))):
+        members = [byId[id] for id in sorted(components.nodes[component]["members"], key=position.get)]
+        if len(members) == 1 and not graph.has_edge(members[0].id, members[0].id):
+            summarizeFunction(members[0], globalIds, sources)
+        else:
+            summarizeRecursive(members, graph, globalIds, sources)
+
+def summarizeRecursive(members, graph, globalIds, sources):
+    # Worklist fixpoint over one component: every member starts out passing
+    # nothing on, and a member whose summary grows puts its callers in the
+    # component back on the worklist. Summaries only ever grow, so this ends
+    # after at most as many rounds as there are flows to find.
+    memberIds = {f.id for f in members}
+    digest = hashlib.sha1()
+    for function in members:
+        text = functionText(function, sources)
+        if text is None:
+            digest = None
+            break
+        digest.update(text + b"|")
+        for callee, args, _ in functionCalls(function):
+            summary = FunctionSummary.forCall(callee, len(args))
+            if summary is not None and summary.functionId not in memberIds:
+                digest.update((summary.key or "").encode() + b"|")
+    keys = [digest.hexdigest() + ":%d" % i if digest is not None else None for i in range(len(members))]
+    if all(key in FunctionSummary.cache for key in keys):
+        for function, key in zip(members, keys):
+            FunctionSummary.fromJson(FunctionSummary.cache[key], function.id, globalIds, key)
+        return
+
+    for function in members:
+        arity = len(FunctionDeclaration.allFuncDeclarations[function.id])
+        FunctionSummary(function.id, function.name, [[] for _ in range(arity)], [False] * arity, [[] for _ in range(arity)], [False] * arity, [False] * arity)
+    worklist = list(members)
+    queued = set(memberIds)
+    while len(worklist) > 0:
+        function = worklist.pop(0)
+        queued.discard(function.id)
+        before = FunctionSummary.allSummaries[function.id].toJson()
+        if summarizeFunction(function, globalIds, sources, cached=False).toJson() != before:
+            for caller in members:
+                if caller.id not in queued and graph.has_edge(caller.id, function.id):
+                    worklist.append(caller)
+                    queued.add(caller.id)
+
+    for function, key in zip(members, keys):
+        summary = FunctionSummary.allSummaries[function.id]
+        summary.key = key
+        if key is not None:
+            FunctionSummary.cache[key] = summary.toJson(globalsAsNames=True)
+
+def functionStatements(function):
+    if function.id not in functionStatementCache:
+        statements = []
+        stack = list(function.inner)
+        while len(stack) > 0:
+            node = stack.pop()
+            statements.append(node)
+            stack.extend(node.inner)
+        functionStatementCache[function.id] = statements
+    return functionStatementCache[function.id]
+
+functionStatementCache = {}
+
+def functionText(function, sources):
+    file = AstNode.fileNames[function.fileIndex] if function.fileIndex is not None else None
+    extent = nodeExtent(function)
+    if file is None or extent is None:
+        return None
+    if file not in sources:
+        try:
+            with open(file, "rb") as sourceFile:
+                sources[file] = sourceFile.read()
+        except OSError:
+            sources[file] = None
+    return sources[file][extent[0]:extent[1]] if sources[file] is not None else None
+
+def functionCalls(function):
+    # (callee, arguments, call) of every call in a function, with the
+    # variables each argument's value comes from. The call facts flatten the
+    # arguments and leave out parameters passed on.
+    if function.id not in functionCallCache:
+        functionCallCache[function.id] = [(node.calledFuncId, callArguments(node), node.id) for node in functionStatements(function) if node.kind == "CallExpr" and node.id in FunctionCall.allFuncCalls]
+    return functionCallCache[function.id]
+
+functionCallCache = {}
+
+def callArguments(node):
+    return [list(flowSources([argument])) for argument in node.inner[1:]]
+
+def summarizeFunction(function, globalIds, sources, cached=True):
+    params = FunctionDeclaration.allFuncDeclarations[function.id]
+    statements = functionStatements(function)
+    calls = functionCalls(function)
+    callees = [FunctionSummary.forCall(callee, len(args)) for callee, args, _ in calls]
+
+    # The text of the function and the summaries it builds on decide it
+    text = functionText(function, sources) if cached else None
+    key = None
+    if text is not None:
+        digest = hashlib.sha1(text)
+        # A callee without a summary counts apart from one without a key,
+        # the summary of the call is different
+        for callee in callees:
+            digest.update(b"|" + (callee.key or "").encode() if callee is not None else b"|-")
+        key = digest.hexdigest()
+        if key in FunctionSummary.cache:
+            return FunctionSummary.fromJson(FunctionSummary.cache[key], function.id, globalIds, key)
+
+    returnId = function.id
+    memcpySink = "memcpy"
+    freeSink = "free"
+    locals = set(params) | {n.id for n in statements if n.kind == "VarDecl"}
+    edges = {}
+    def addEdge(src, dst):
+        if src is not None and dst is not None:
+            edges.setdefault(src, set()).add(dst)
+
+    # The assignment facts leave out parameters on the right, so the values
+    # are followed through the references themselves
+    for node in statements:
+        if node.kind == "VarDecl":
+            for source in flowSources(node.inner):
+                addEdge(source, node.id)
+        elif node.kind == "BinaryOperator" and node.opcode == "=" and len(node.inner) == 2:
+            target = referencedVariable(node.inner[0])
+            targets = [target] if target is not None else list(flowSources([node.inner[0]]))
+            for source in flowSources([node.inner[1]]):
+                for target in targets:
+                    addEdge(source, target)
+        elif node.kind == "ReturnStmt":
+            for source in flowSources(node.inner):
+                addEdge(source, returnId)
+    for (calleeId, args, callId), summary in zip(calls, callees):
+        if calleeId == FunctionDeclaration.memcpyId and len(args) > 1:
+            for src in args[1]:
+                for dst in args[0]:
+                    addEdge(src, dst)
+                addEdge(src, memcpySink)
+        if calleeId == FunctionDeclaration.freeId:
+            for arg in args:
+                for src in arg:
+                    addEdge(src, freeSink)
+        if summary is None or len(summary.params) != len(args):
+            continue
+        for k, arg in enumerate(args):
+            reached = [dst for j in summary.params[k] for dst in args[j]] + summary.globals[k]
+            reached += [callId] if summary.returns[k] else []
+            reached += [memcpySink] if summary.memcpy[k] else []
+            reached += [freeSink] if summary.free[k] else []
+            for src in arg:
+                for dst in reached:
+                    addEdge(src, dst)
+
+    reachedParams, returns, globals, memcpy, free = [], [], [], [], []
+    for param in params:
+        reached = {param}
+        stack = [param]
+        while len(stack) > 0:
+            for dst in edges.get(stack.pop(), ()):
+                if dst not in reached:
+                    reached.add(dst)
+                    stack.append(dst)
+        reachedParams.append([j for j, other in enumerate(params) if other != param and other in reached])
+        returns.append(returnId in reached)
+        globals.append([g for g in reached if g not in locals and g in Variable.allVars and g not in FunctionCall.allFuncCalls])
+        memcpy.append(memcpySink in reached)
+        free.append(freeSink in reached)
+
+    summary = FunctionSummary(function.id, function.name, reachedParams, returns, globals, memcpy, free, key)
+    if key is not None:
+        FunctionSummary.cache[key] = summary.toJson(globalsAsNames=True)
+    return summary
+
+def flowSources(nodes):
+    # The variables and call results an expression's value comes from
+    stack = list(nodes)
+    while len(stack) > 0:
+        node = stack.pop()
+        if node.kind == "CallExpr":
+            yield node.id
+        elif node.kind == "DeclRefExpr":
+            if node.referencedDecl is not None and node.referencedDecl.kind in ["VarDecl", "ParmVarDecl"]:
+                yield node.referencedDecl.id
+        else:
+            stack.extend(node.inner)
+
+def loadSummaryCache():
+    # Without a file the summaries of the last run in this process are kept
+    if summaryCacheFilename is not None and os.path.exists(summaryCacheFilename):
+        with open(summaryCacheFilename) as cacheFile:
+            FunctionSummary.cache = json.load(cacheFile)
+
+def saveSummaryCache():
+    if summaryCacheFilename is not None:
+        with open(summaryCacheFilename, "w") as cacheFile:
+            json.dump(FunctionSummary.cache, cacheFile)
+
 def getNameById(id):
-    return str(AstNode.allNodes[id].name)
+    # With summaries a call result is a variable of its own, named after the
+    # call in allVars since the call has no name
+    node = AstNode.allNodes[id]
+    return str(node.name) if hasattr(node, "name") else str(Variable.allVars.get(id))
+
+def fileIndexFor(file):
+    index = AstNode.fileIndexes.get(file)
+    if index is None:
+        index = len(AstNode.fileNames)
+        AstNode.fileIndexes[file] = index
+        AstNode.fileNames.append(file)
+    return index
+
+def analyzedFileMask():
+    # One flag per file index, set for the files in analyzedFiles
+    mask = [False] * len(AstNode.fileNames)
+    for file in analyzedFiles or [srcFilename]:
+        index = AstNode.fileIndexes.get(file)
+        if index is not None:
+            mask[index] = True
+    return mask
 
 def getFileById(id):
-    return str(AstNode.allNodes[id].file)
+    index = AstNode.nodeFileIndexes[id]
+    return str(AstNode.fileNames[index] if index is not None else None)
 
 def getNameIdMix(id):
-    return str(AstNode.allNodes[id].name) + "." + str(id)
-
-def climbAST():
-    r = subprocess.run(["clang", "-Xclang", "-ast-dump=json", srcFilename], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-    data = json.loads(r.stdout)
+    # Variables built in a shard only have their name in allVars
+    name = Variable.allVars[id] if id in Variable.allVars else AstNode.allNodes[id].name
+    return str(name) + "." + str(id)
+
+def resetState():
+    # Forget everything collected from the last translation unit
+    Variable.allVars.clear()
+    Variable.varToTraceId = None
+    VariableAssignment.allAssignments.clear()
+    VariableAssignment.allAssignmentsByName.clear()
+    FunctionDeclaration.allFuncDeclarations.clear()
+    FunctionDeclaration.allFuncDeclByName.clear()
+    FunctionDeclaration.memcpyId = None
+    FunctionDeclaration.freeId = None
+    FunctionCall.allFuncCalls.clear()
+    AstNode.allNodes.clear()
+    AstNode.currentFile = None
+    AstNode.currentFileIndex = None
+    AstNode.firstSrcFileNode = None
+    AstNode.fileIndexes.clear()
+    AstNode.fileNames.clear()
+    AstNode.nodeFileIndexes.clear()
+    AstNode.shardRoot = None
+    AstNode.shardOwners.clear()
+    AstNode.shardStartFiles.clear()
+    AstNode.shardFirstSrcFilePosition = None
+    AstNode.shardBuilt.clear()
+    FunctionSummary.allSummaries.clear()
+    FunctionSummary.byNameAndArity.clear()
+    functionStatementCache.clear()
+    functionCallCache.clear()
+    lineStarts.clear()
+    HeaderCache.keys.clear()
+    HeaderCache.found.clear()
+    HeaderCache.built.clear()
+    FunctionLayout.allLayouts.clear()
+
+def resolveJsonBackend(backend):
+    if backend == "auto":
+        # On-demand decoding pays off when most of the tree is never read
+        if lazyChildren and simdjson is not None:
+            return "simdjson"
+        if orjson is not None:
+            return "orjson"
+        if simdjson is not None:
+            return "simdjson"
+        return "json"
+    if backend == "orjson" and orjson is None or backend == "simdjson" and simdjson is None:
+        print("JSON backend " + backend + " isn't installed, falling back to json")
+        return "json"
+    return backend
+
+jsonParser = None
+
+def decodeAST(raw, backend=None):
+    # raw is the dump as bytes, exactly as it comes out of clang's stdout
+    global jsonParser
+    backend = resolveJsonBackend(jsonBackend if backend is None else backend)
+    if backend == "orjson":
+        return orjson.loads(raw)
+    if backend == "simdjson":
+        # The returned proxies are only valid while their parser is alive
+        jsonParser = simdjson.Parser()
+        return jsonParser.parse(raw)
+    return json.loads(raw)
+
+def pchArgs():
+    return ["-include-pch", pchInUse] if pchInUse is not None else []
+
+def includePrefix(source):
+    # The include lines a source starts with, up to the first other line
+    # that isn't blank or a comment
+    includes = []
+    with open(source, errors="replace") as sourceFile:
+        for line in sourceFile:
+            line = line.strip()
+            if line.startswith("#include"):
+                includes.append(line)
+            elif len(line) > 0 and not line.startswith("//"):
+                break
+    return includes
+
+def probePch(header, name, pch, language):
+    # Whether name is declared by the prefix, and as what, through the
+    # header itself or through the precompiled header
+    with tempfile.TemporaryDirectory() as probeDir:
+        probe = os.path.join(probeDir, "probe.c" if language == "c-header" else "probe.cc")
+        with open(probe, "w") as probeFile:
+            if pch is None:
+                probeFile.write('#include "%s"\n' % os.path.abspath(header))
+            probeFile.write("void __astClimberProbe(void) { (void)&%s; }\n" % name)
+        r = subprocess.run(["clang", "-Xclang", "-ast-dump=json"] + clangArgs + (["-include-pch", pch] if pch is not None else []) + [probe], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    stack = [decodeAST(r.stdout)] if len(r.stdout) > 0 else []
+    while len(stack) > 0:
+        node = stack.pop()
+        if node.get("kind") == "DeclRefExpr" and node["referencedDecl"].get("name") == name:
+            return node["referencedDecl"].get("type", {}).get("qualType")
+        stack.extend(node.get("inner", []))
+    return None
+
+def preparePch(sources):
+    # Build the precompiled header of the include lines all sources start
+    # with, or reuse it while the includes, clang's arguments and every
+    # header it was built from are unchanged. It's only used when memcpy()
+    # and free() come out of it declared as they are by the headers.
+    global pchInUse
+    pchInUse = None
+    prefixes = [includePrefix(source) for source in sources]
+    includes = prefixes[0]
+    for prefix in prefixes[1:]:
+        length = 0
+        while length < min(len(includes), len(prefix)) and includes[length] == prefix[length]:
+            length += 1
+        includes = includes[:length]
+    if len(includes) == 0:
+        print("No include lines all the sources start with, not using a precompiled header")
+        return
+    if len({source.endswith(".c") for source in sources}) > 1:
+        print("C and C++ sources mixed, not using a precompiled header")
+        return
+    language = "c-header" if sources[0].endswith(".c") else "c++-header"
+
+    header = pchFilename + ".h"
+    with open(header, "w") as headerFile:
+        headerFile.write("\n".join(includes) + "\n")
+    # The dump of a unit leaves out everything declared in the precompiled
+    # header, parameters and bodies included, so only system headers, which
+    # aren't traced into, may go into it
+    r = subprocess.run(["clang", "-x", language] + clangArgs + ["-MM", header], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    userHeaders = r.stdout.replace("\\\n", " ").split()[2:]
+    if r.returncode != 0 or len(userHeaders) > 0:
+        print("The include lines bring in %s, not using a precompiled header" % (", ".join(userHeaders) if r.returncode == 0 else "headers clang can't find"))
+        return
+
+    stampFilename = pchFilename + ".json"
+    stamp = {"includes": includes, "clangArgs": clangArgs, "language": language}
+    if os.path.exists(pchFilename) and os.path.exists(stampFilename):
+        with open(stampFilename) as stampFile:
+            built = json.load(stampFile)
+        dependencies = built.pop("dependencies", {})
+        if built == stamp and all(FileWatcher.mtime(file) == mtime for file, mtime in dependencies.items()):
+            pchInUse = pchFilename
+            return
+
+    dependencyFilename = pchFilename + ".d"
+    start = time.perf_counter()
+    r = subprocess.run(["clang", "-x", language] + clangArgs + [header, "-o", pchFilename, "-MD", "-MF", dependencyFilename], stderr=subprocess.PIPE, text=True)
+    if r.returncode != 0 or not os.path.exists(pchFilename):
+        print("Couldn't build the precompiled header " + pchFilename + ":")
+        print(r.stderr)
+        return
+    print("Built %s from %d includes in %.0f ms" % (pchFilename, len(includes), (time.perf_counter() - start) * 1e3))
+
+    for name in ["memcpy", "free"]:
+        expected = probePch(header, name, None, language)
+        found = probePch(header, name, pchFilename, language)
+        if expected != found:
+            print("%s() is %s with %s but %s without it, not using it" % (name, found, pchFilename, expected))
+            return
+
+    dependencies = []
+    if os.path.exists(dependencyFilename):
+        with open(dependencyFilename) as dependencyFile:
+            dependencies = dependencyFile.read().replace("\\\n", " ").split()[1:]
+    stamp["dependencies"] = {file: FileWatcher.mtime(file) for file in dependencies}
+    with open(stampFilename, "w") as stampFile:
+        json.dump(stamp, stampFile)
+    pchInUse = pchFilename
+
+class DumpFailed(Exception):
+    pass
+
+def dumpCommand(source):
+    # -fsyntax-only, the dump is all that's wanted out of clang
+    return ["clang", "-fsyntax-only", "-Xclang", "-ast-dump=json"] + clangArgs + pchArgs() + [source]
+
+def clangLimits():
+    # preexec_fn isn't safe with other threads running, so it's only there
+    # when there's a limit to set
+    return {"preexec_fn": limitClangMemory} if memoryLimit is not None else {}
+
+def dumpOutcome(raw, returncode):
+    # clang still dumps the AST of a unit with errors, which would then be
+    # instrumented as if it were fine
+    if returncode != 0:
+        return None, "clang exited with %d" % returncode
+    if len(raw) == 0:
+        return None, "clang exited with 0 and no dump"
+    return raw, None
+
+def dumpOnce(source):
+    # One try at the dump of a unit, None and why if it failed
+    process = subprocess.Popen(dumpCommand(source), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, start_new_session=True, **clangLimits())
+    try:
+        raw, _ = process.communicate(timeout=clangTimeout)
+    except subprocess.TimeoutExpired:
+        # clang may be a driver with the compiler still running under it
+        os.killpg(process.pid, signal.SIGKILL)
+        process.communicate()
+        return None, "clang took longer than %g s" % clangTimeout
+    return dumpOutcome(raw, process.returncode)
+
+def dumpAST(source=None):
+    # The dump of source, srcFilename by default, tried dumpRetries more
+    # times before giving up on it with DumpFailed
+    source = srcFilename if source is None else source
+    for attempt in range(dumpRetries + 1):
+        raw, reason = dumpOnce(source)
+        if raw is not None:
+            return raw
+    raise DumpFailed("%s: %s" % (source, reason))
+
+# Cursor kinds whose names don't turn into the matching clang JSON kind by
+# just camel-casing them
+cursorKindNames = {
+    "CLASS_DECL"                   : "CXXRecordDecl",
+    "COMPOUND_ASSIGNMENT_OPERATOR" : "CompoundAssignOperator",
+    "CONSTRUCTOR"                  : "CXXConstructorDecl",
+    "CSTYLE_CAST_EXPR"             : "CStyleCastExpr",
+    "CXX_METHOD"                   : "CXXMethodDecl",
+    "CXX_NULL_PTR_LITERAL_EXPR"    : "CXXNullPtrLiteralExpr",
+    "CXX_STATIC_CAST_EXPR"         : "CXXStaticCastExpr",
+    "CXX_UNARY_EXPR"               : "UnaryExprOrTypeTraitExpr",
+    "DESTRUCTOR"                   : "CXXDestructorDecl",
+    "GNU_NULL_EXPR"                : "GNUNullExpr",
+    "NAMESPACE"                    : "NamespaceDecl",
+    "PARM_DECL"                    : "ParmVarDecl",
+    "STRUCT_DECL"                  : "CXXRecordDecl",
+    "TRANSLATION_UNIT"             : "TranslationUnitDecl"
+}
 
-    with open("out.json", "w") as dbgFile:
-        json.dump(data, dbgFile, indent = 3)
+def cursorKindName(cursorKind):
+    name = cursorKindNames.get(cursorKind.name)
+    if name is None:
+        name = "".join(word.capitalize() for word in cursorKind.name.split("_"))
+        cursorKindNames[cursorKind.name] = name
+    return name
+
+class CursorTree:
+    # Turns the cursors of a translation unit into the same dicts the JSON
+    # frontend decodes, so they go through the node classes unchanged. Only
+    # the cursors in srcFilename are visited, plus the parameters of the
+    # functions declared elsewhere that they call.
+    def __init__(self, translationUnit):
+        self.translationUnit = translationUnit
+        self.declIds = {}
+        self.nextId = 0
+        self.externalFuncs = {}
+        self.expansions = []
+
+    def newId(self):
+        self.nextId += 1
+        return hex(self.nextId)
+
+    def declId(self, cursor):
+        # References have to end up with the id of the declaration itself
+        location = cursor.location
+        key = (cursor.kind.value, location.file.name if location.file is not None else None, location.offset)
+        id = self.declIds.get(key)
+        if id is None:
+            id = self.newId()
+            self.declIds[key] = id
+        return id
+
+    def isVisited(self, cursor):
+        kind = cursor.kind
+        if kind.is_reference() or kind.is_attribute() or kind.is_preprocessing():
+            return False
+        return isRelevantKind(cursorKindName(kind))
+
+    def operatorSpelling(self, cursor, lhs):
+        # The operator is the first token after the left-hand side
+        extent = clang.cindex.SourceRange.from_locations(lhs.extent.end, cursor.extent.end)
+        for token in self.translationUnit.get_tokens(extent=extent):
+            return token.spelling
+        return None
+
+    def convert(self, cursor, bodies=True):
+        kind = cursorKindName(cursor.kind)
+        isDecl = cursor.kind.is_declaration()
+        node = {"id": self.declId(cursor) if isDecl else self.newId(), "kind": kind}
+
+        location = cursor.location
+        if location.file is not None:
+            node["loc"] = {"offset": location.offset, "line": location.line, "col": location.column, "file": location.file.name}
+        # Ranges are closed on the end of the last token, clang's JSON has the
+        # start of the last token plus its length instead
+        extent = cursor.extent
+        node["range"] = {"begin": self.rangeLocation(extent.start.offset, False), "end": self.rangeLocation(extent.end.offset, True)}
+        if isDecl and len(cursor.spelling) > 0:
+            node["name"] = cursor.spelling
+
+        children = [c for c in cursor.get_children() if self.isVisited(c)]
+        if not bodies:
+            children = [c for c in children if c.kind == clang.cindex.CursorKind.PARM_DECL]
+        if kind == "BinaryOperator" and len(children) > 0:
+            node["opcode"] = self.operatorSpelling(cursor, children[0])
+        elif kind == "IfStmt" and len(children) > 2:
+            node["hasElse"] = True
+        elif kind == "DeclRefExpr":
+            referenced = cursor.referenced
+            if referenced is not None:
+                node["referencedDecl"] = {"id": self.declId(referenced), "kind": cursorKindName(referenced.kind), "name": referenced.spelling}
+                if referenced.kind == clang.cindex.CursorKind.FUNCTION_DECL:
+                    file = referenced.location.file
+                    if file is None or file.name != srcFilename:
+                        self.externalFuncs[self.declId(referenced)] = referenced
+
+        if len(children) > 0:
+            node["inner"] = [self.convert(c, bodies) for c in children]
+        return node
+
+    def rangeLocation(self, offset, isEnd):
+        # A range that starts or ends in a macro expansion has no offset of
+        # its own in clang's JSON, only the spelling and expansion locations,
+        # and nothing gets inserted there. The end offset of libclang's
+        # ranges is past the last token, so it's at most the expansion's end.
+        i = bisect.bisect_right(self.expansions, (offset, sys.maxsize)) - 1
+        if i >= 0 and (self.expansions[i][0] < offset <= self.expansions[i][1] if isEnd else offset < self.expansions[i][1]):
+            start, end, nameLength = self.expansions[i]
+            return {"spellingLoc": {}, "expansionLoc": {"offset": start, "tokLen": nameLength}}
+        return {"offset": offset, "tokLen": 0} if isEnd else {"offset": offset}
+
+    def root(self):
+        cursors = []
+        for cursor in self.translationUnit.cursor.get_children():
+            file = cursor.location.file
+            if file is not None and file.name == srcFilename:
+                if cursor.kind == clang.cindex.CursorKind.MACRO_INSTANTIATION:
+                    self.expansions.append((cursor.extent.start.offset, cursor.extent.end.offset, len(cursor.spelling)))
+                elif self.isVisited(cursor):
+                    cursors.append(cursor)
+        self.expansions.sort()
+        inner = [self.convert(cursor) for cursor in cursors]
+
+        # Declarations from the headers come first, like in the JSON dump
+        externalDecls = [self.convert(c, bodies=False) for c in self.externalFuncs.values()]
+        return {"id": self.newId(), "kind": "TranslationUnitDecl", "loc": {}, "range": {"begin": {}, "end": {}}, "inner": externalDecls + inner}
+
+def parseCursors():
+    if clang is None:
+        raise RuntimeError("The libclang frontend needs the clang.cindex Python bindings")
+    # The detailed processing record has the macro expansions
+    translationUnit = clang.cindex.Index.create().parse(srcFilename, args=clangArgs, options=clang.cindex.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD)
+    # Like the dump, a unit with errors would be instrumented as if it were
+    # fine
+    errors = [diagnostic for diagnostic in translationUnit.diagnostics if diagnostic.severity >= clang.cindex.Diagnostic.Error]
+    if len(errors) > 0:
+        raise DumpFailed("%s: %s" % (srcFilename, errors[0].spelling))
+    return CursorTree(translationUnit).root()
+
+def shardedFacts():
+    return [Variable.allVars, VariableAssignment.allAssignments, VariableAssignment.allAssignmentsByName,
+            FunctionDeclaration.allFuncDeclarations, FunctionDeclaration.allFuncDeclByName, FunctionCall.allFuncCalls]
+
+def intId(id):
+    # clang's ids are hex pointers (the libclang frontend's are small hex
+    # numbers), 0 stands for a missing one
+    return int(id, 16) if id is not None else 0
+
+def hexId(value):
+    return hex(value) if value != 0 else None
+
+class FactTable:
+    # The facts of a translation unit as flat integer columns, written after
+    # a JSON header and read back through memoryviews of an mmap. Lists per
+    # row (right-hand sides, parameters, arguments) are one flat column plus
+    # a column of n + 1 start indexes into it, names are slices of one
+    # string blob, empty for a missing name and prefixed by a 1 byte
+    # otherwise.
+    magic = b"ASTFACT1"
+    columns = ["nodeId", "nodeKind", "nodeFile", "nodeOffset", "nodeOwner",
+               "varId", "varName",
+               "assignId", "assignLeft", "assignInit", "assignRightStart", "assignRight",
+               "declId", "declName", "declParamStart", "declParam",
+               "callId", "callCallee", "callArgStart", "callArg"]
+
+    @staticmethod
+    def write(filename, facts=None, owners={}, header={}):
+        # facts are the registries in the order of shardedFacts(), all of
+        # them by default. owners holds the top-level position of ids.
+        allVars, allAssignments, _, allFuncDeclarations, allFuncDeclByName, allFuncCalls = facts if facts is not None else shardedFacts()
+        columns = {name: array("q") for name in FactTable.columns}
+        strings = bytearray()
+        kinds = {}
+
+        def addString(column, string):
+            columns[column].append(len(strings))
+            strings.extend(b"\x01" + string.encode() if string is not None else b"")
+        def addList(start, column, ids):
+            columns[start].append(len(columns[column]))
+            columns[column].extend(intId(id) for id in ids)
+
+        for id, name in allVars.items():
+            columns["varId"].append(intId(id))
+            addString("varName", name)
+        columns["varName"].append(len(strings))
+        for id, (left, right, isInitialization) in allAssignments.items():
+            columns["assignId"].append(intId(id))
+            columns["assignLeft"].append(intId(left))
+            columns["assignInit"].append(int(isInitialization))
+            addList("assignRightStart", "assignRight", right)
+        columns["assignRightStart"].append(len(columns["assignRight"]))
+        for id, params in allFuncDeclarations.items():
+            columns["declId"].append(intId(id))
+            addString("declName", allFuncDeclByName[id][0])
+            addList("declParamStart", "declParam", params)
+        columns["declName"].append(len(strings))
+        columns["declParamStart"].append(len(columns["declParam"]))
+        for id, (callee, args) in allFuncCalls.items():
+            columns["callId"].append(intId(id))
+            columns["callCallee"].append(intId(callee))
+            addList("callArgStart", "callArg", args)
+        columns["callArgStart"].append(len(columns["callArg"]))
+
+        for id in dict.fromkeys([*allVars, *allAssignments, *allFuncDeclarations, *allFuncCalls]):
+            node = AstNode.allNodes.get(id)
+            fileIndex = AstNode.nodeFileIndexes.get(id)
+            columns["nodeId"].append(intId(id))
+            columns["nodeKind"].append(kinds.setdefault(node.kind if node is not None else None, len(kinds)))
+            columns["nodeFile"].append(fileIndex if fileIndex is not None else -1)
+            offset = node.range.begin.offset if node is not None and node.range is not None and node.range.begin is not None else None
+            columns["nodeOffset"].append(offset if offset is not None else -1)
+            columns["nodeOwner"].append(owners.get(id, -1))
+
+        # Every column starts on an 8 byte boundary after the header
+        layout = {}
+        offset = 0
+        for name in FactTable.columns:
+            layout[name] = (offset, len(columns[name]))
+            offset += len(columns[name]) * 8
+        layout["strings"] = (offset, len(strings))
+        header = dict(header, byteorder=sys.byteorder, files=AstNode.fileNames, kinds=list(kinds), layout=layout)
+        encoded = json.dumps(header).encode()
+        encoded += b" " * (-(len(FactTable.magic) + 8 + len(encoded)) % 8)
+        with open(filename, "wb") as factsFile:
+            factsFile.write(FactTable.magic + len(encoded).to_bytes(8, "little") + encoded)
+            for name in FactTable.columns:
+                columns[name].tofile(factsFile)
+            factsFile.write(strings)
+
+    def __init__(self, filename):
+        with open(filename, "rb") as factsFile:
+            self.mmap = mmap.mmap(factsFile.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mmap[:len(FactTable.magic)] != FactTable.magic:
+            raise ValueError(filename + " isn't a fact table")
+        start = len(FactTable.magic) + 8
+        headerLength = int.from_bytes(self.mmap[len(FactTable.magic):start], "little")
+        self.header = json.loads(self.mmap[start:start + headerLength])
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError(filename + " was written on a machine of the other byte order")
+        view = memoryview(self.mmap)[start + headerLength:]
+        for name in FactTable.columns:
+            offset, count = self.header["layout"][name]
+            setattr(self, name, view[offset:offset + count * 8].cast("q"))
+        offset, count = self.header["layout"]["strings"]
+        self.strings = view[offset:offset + count]
+
+    def close(self):
+        for name in FactTable.columns + ["strings"]:
+            getattr(self, name).release()
+        self.mmap.close()
+
+    def string(self, column, row):
+        start, end = column[row], column[row + 1]
+        return bytes(self.strings[start + 1:end]).decode() if end > start else None
+
+    def rows(self, ids, start, values):
+        # The flat list of every row, as hex ids
+        return [[hexId(v) for v in values[start[row]:start[row + 1]]] for row in range(len(ids))]
+
+    def column(self, name):
+        # A column as a NumPy array over the mmap, nothing copied. Arrays
+        # still alive keep close() from releasing the columns.
+        return np.frombuffer(getattr(self, name), dtype=np.int64)
+
+    @staticmethod
+    def lookup(ids, wanted):
+        # The row of each wanted id in ids, -1 where it's missing. The first
+        # row of an id wins, like it does in merge().
+        order = np.argsort(ids, kind="stable")
+        if len(order) == 0:
+            return np.full(len(wanted), -1)
+        at = order[np.minimum(np.searchsorted(ids[order], wanted), len(order) - 1)]
+        return np.where(ids[at] == wanted, at, -1)
+
+    def edges(self):
+        # dependencyEdges() straight from the columns, as arrays of source and
+        # destination ids in the same order, without registering the facts.
+        # The files analyzed are the ones the table was written for.
+        analyzed = set(self.header.get("analyzed", analyzedFiles or [srcFilename]))
+        fileMask = np.array([file in analyzed for file in self.header["files"]] + [False])
+        nodeFile = self.column("nodeFile")
+        nodeId = self.column("nodeId")
+        def inAnalyzedFiles(ids):
+            rows = FactTable.lookup(nodeId, ids)
+            return (rows >= 0) & fileMask[nodeFile[rows]]
+
+        # All the assignments
+        rightStart = self.column("assignRightStart")
+        right = self.column("assignRight")
+        left = np.repeat(self.column("assignLeft"), np.diff(rightStart))
+        keep = (right != 0) & inAnalyzedFiles(left) & inAnalyzedFiles(right)
+        edges = [(right[keep], left[keep])]
+
+        # All the function calls, the arguments of those with as many as
+        # their declaration has parameters
+        argStart = self.column("callArgStart")
+        args = self.column("callArg")
+        callee = self.column("callCallee")
+        argCount = np.diff(argStart)
+        paramStart = self.column("declParamStart")
+        declRows = FactTable.lookup(self.column("declId"), callee)
+        matches = (declRows >= 0) & (np.diff(paramStart)[declRows] == argCount)
+        callRows = np.repeat(np.arange(len(callee)), argCount)
+        valid = matches[callRows]
+        params = np.zeros_like(args)
+        params[valid] = self.column("declParam")[paramStart[declRows[callRows[valid]]] + np.arange(len(args))[valid] - argStart[callRows[valid]]]
+        keep = valid & (args != 0) & inAnalyzedFiles(args) & inAnalyzedFiles(params)
+        edges.append((args[keep], params[keep]))
+
+        # All the deep copies from calls of memcpy
+        memcpyCalls = np.flatnonzero((callee == intId(self.header.get("memcpyId"))) & (callee != 0) & (argCount >= 2))
+        dst = args[argStart[memcpyCalls]]
+        src = args[argStart[memcpyCalls] + 1]
+        keep = (dst != 0) & (src != 0) & inAnalyzedFiles(dst) & inAnalyzedFiles(src)
+        edges.append((src[keep], dst[keep]))
+        return np.concatenate([src for src, _ in edges]), np.concatenate([dst for _, dst in edges])
+
+    def copies(self, traceId):
+        # buildDependencyGraph() over edges(), as hex ids. A variable that
+        # flows nowhere is its only copy.
+        src, dst = self.edges()
+        graph = nx.DiGraph()
+        graph.add_edges_from(zip(src.tolist(), dst.tolist()))
+        if intId(traceId) not in graph:
+            return [traceId]
+        return [hexId(id) for id in nx.shortest_path(graph, intId(traceId))]
+
+    def describe(self, ids):
+        # The name and file of each of a few hex ids
+        varRows = FactTable.lookup(self.column("varId"), np.array([intId(id) for id in ids], dtype=np.int64))
+        nodeRows = FactTable.lookup(self.column("nodeId"), np.array([intId(id) for id in ids], dtype=np.int64))
+        nodeFile = self.column("nodeFile")
+        return [(self.string(self.varName, varRow) if varRow >= 0 else None, self.header["files"][nodeFile[nodeRow]] if nodeRow >= 0 and nodeFile[nodeRow] >= 0 else None)
+                for varRow, nodeRow in zip(varRows.tolist(), nodeRows.tolist())]
+
+    def merge(self):
+        # Register the facts as if they'd been found here, later facts win
+        # like they do during ingestion. Returns the owners of the ids.
+        varNames = {}
+        for row, id in enumerate(map(hexId, self.varId)):
+            varNames[id] = Variable.allVars[id] = self.string(self.varName, row)
+        names = lambda ids: [varNames.get(id, Variable.allVars.get(id)) if id is not None else None for id in ids]
+        for id, left, isInitialization, right in zip(map(hexId, self.assignId), map(hexId, self.assignLeft), self.assignInit, self.rows(self.assignId, self.assignRightStart, self.assignRight)):
+            VariableAssignment.allAssignments[id] = (left, right, bool(isInitialization))
+            VariableAssignment.allAssignmentsByName[id] = (names([left])[0], [str(name) if name is not None else None for name in names(right)], bool(isInitialization))
+        for row, (id, params) in enumerate(zip(map(hexId, self.declId), self.rows(self.declId, self.declParamStart, self.declParam))):
+            FunctionDeclaration.allFuncDeclarations[id] = params
+            FunctionDeclaration.allFuncDeclByName[id] = (self.string(self.declName, row), names(params))
+        for id, callee, args in zip(map(hexId, self.callId), map(hexId, self.callCallee), self.rows(self.callId, self.callArgStart, self.callArg)):
+            FunctionCall.allFuncCalls[id] = (callee, args)
+
+        # File indexes are only meaningful with the file names they came with
+        remapped = [fileIndexFor(file) for file in self.header["files"]]
+        owners = {}
+        for id, fileIndex, owner in zip(map(hexId, self.nodeId), self.nodeFile, self.nodeOwner):
+            AstNode.nodeFileIndexes.setdefault(id, remapped[fileIndex] if fileIndex >= 0 else None)
+            if owner >= 0:
+                owners[id] = owner
+
+        if Variable.varToTraceId is None:
+            Variable.varToTraceId = self.header.get("varToTraceId")
+        if self.header.get("memcpyId") is not None:
+            FunctionDeclaration.memcpyId = self.header["memcpyId"]
+        if self.header.get("freeId") is not None:
+            FunctionDeclaration.freeId = self.header["freeId"]
+        return owners
+
+class FactDatabase:
+    # The facts of many translation units in SQLite, keyed by the unit and
+    # the integer id (see intId()). Copies are found with a recursive query
+    # that follows calls into other units by function name, and saved.
+    schema = """
+        CREATE TABLE IF NOT EXISTS units(tu INTEGER PRIMARY KEY, src TEXT UNIQUE);
+        CREATE TABLE IF NOT EXISTS analyzed(tu INTEGER, file TEXT, PRIMARY KEY(tu, file));
+        CREATE TABLE IF NOT EXISTS nodes(tu INTEGER, id INTEGER, kind TEXT, file TEXT, offset INTEGER, PRIMARY KEY(tu, id));
+        CREATE TABLE IF NOT EXISTS vars(tu INTEGER, id INTEGER, name TEXT, PRIMARY KEY(tu, id));
+        CREATE TABLE IF NOT EXISTS assignments(tu INTEGER, id INTEGER, lhs INTEGER, init INTEGER, PRIMARY KEY(tu, id));
+        CREATE TABLE IF NOT EXISTS rhs(tu INTEGER, assignment INTEGER, position INTEGER, var INTEGER);
+        CREATE TABLE IF NOT EXISTS decls(tu INTEGER, id INTEGER, name TEXT, paramCount INTEGER, PRIMARY KEY(tu, id));
+        CREATE TABLE IF NOT EXISTS params(tu INTEGER, decl INTEGER, position INTEGER, param INTEGER);
+        CREATE TABLE IF NOT EXISTS calls(tu INTEGER, id INTEGER, callee INTEGER, argCount INTEGER, PRIMARY KEY(tu, id));
+        CREATE TABLE IF NOT EXISTS args(tu INTEGER, call INTEGER, position INTEGER, arg INTEGER);
+        CREATE TABLE IF NOT EXISTS copies(traceTu INTEGER, traceId INTEGER, tu INTEGER, id INTEGER);
+
+        CREATE INDEX IF NOT EXISTS nodesByFile ON nodes(file);
+        CREATE INDEX IF NOT EXISTS assignmentsByLhs ON assignments(tu, lhs);
+        CREATE INDEX IF NOT EXISTS rhsByVar ON rhs(tu, var);
+        CREATE INDEX IF NOT EXISTS declsByName ON decls(name);
+        CREATE INDEX IF NOT EXISTS paramsByDecl ON params(tu, decl, position);
+        CREATE INDEX IF NOT EXISTS callsByCallee ON calls(tu, callee);
+        CREATE INDEX IF NOT EXISTS argsByArg ON args(tu, arg);
+        CREATE INDEX IF NOT EXISTS argsByCall ON args(tu, call, position);
+        CREATE INDEX IF NOT EXISTS copiesByTrace ON copies(traceTu, traceId);
+
+        -- Only nodes of the analyzed files of their unit take part in flows
+        CREATE VIEW IF NOT EXISTS analyzedNodes AS
+            SELECT nodes.tu, nodes.id FROM nodes JOIN analyzed ON analyzed.tu = nodes.tu AND analyzed.file = nodes.file;
+    """
 
-    return nodeKindMap[data["kind"]](data, None)
+    # Each step mirrors an edge of buildDependencyGraph(), a call reaches the
+    # parameters of the declaration it calls and of every declaration of the
+    # same name in other units
+    reachQuery = """
+        WITH RECURSIVE reach(tu, id) AS (
+            VALUES (:tu, :id)
+            UNION
+            SELECT a.tu, a.lhs FROM reach r
+                JOIN analyzedNodes s ON s.tu = r.tu AND s.id = r.id
+                JOIN rhs x ON x.tu = r.tu AND x.var = r.id
+                JOIN assignments a ON a.tu = x.tu AND a.id = x.assignment
+                JOIN analyzedNodes d ON d.tu = a.tu AND d.id = a.lhs
+            UNION
+            SELECT p.tu, p.param FROM reach r
+                JOIN analyzedNodes s ON s.tu = r.tu AND s.id = r.id
+                JOIN args g ON g.tu = r.tu AND g.arg = r.id
+                JOIN calls c ON c.tu = g.tu AND c.id = g.call
+                JOIN decls callee ON callee.tu = c.tu AND callee.id = c.callee
+                JOIN decls f ON f.name = callee.name AND f.paramCount = c.argCount AND (f.tu = c.tu AND f.id = c.callee OR f.tu != c.tu)
+                JOIN params p ON p.tu = f.tu AND p.decl = f.id AND p.position = g.position
+                JOIN analyzedNodes d ON d.tu = p.tu AND d.id = p.param
+            UNION
+            SELECT dst.tu, dst.arg FROM reach r
+                JOIN analyzedNodes s ON s.tu = r.tu AND s.id = r.id
+                JOIN args src ON src.tu = r.tu AND src.arg = r.id AND src.position = 1
+                JOIN calls c ON c.tu = src.tu AND c.id = src.call
+                JOIN decls f ON f.tu = c.tu AND f.id = c.callee AND f.name = 'memcpy'
+                JOIN args dst ON dst.tu = c.tu AND dst.call = c.id AND dst.position = 0
+                JOIN analyzedNodes d ON d.tu = dst.tu AND d.id = dst.arg
+        )
+        SELECT :tu, :id, tu, id FROM reach
+    """
 
-def buildDependencyGraph():
-    dependencyGraph = nx.DiGraph()
-    dependencyGraphNamed= nx.DiGraph()
+    # The same plan as planInstrumentation(), for the copies in one unit
+    planQuery = """
+        SELECT * FROM (
+            SELECT c.rowid AS copyOrder, 0 AS kindOrder, a.rowid AS siteOrder, c.id AS copy, 'Initialization' AS comment, a.id AS site
+                FROM copies c JOIN assignments a ON a.tu = c.tu AND a.id = c.id AND a.init = 1
+                WHERE c.traceTu = :traceTu AND c.traceId = :traceId AND c.tu = :tu
+            UNION ALL
+            SELECT c.rowid, 1, a.rowid, c.id, 'Assignment', a.id
+                FROM copies c JOIN assignments a ON a.tu = c.tu AND a.lhs = c.id AND a.init = 0
+                WHERE c.traceTu = :traceTu AND c.traceId = :traceId AND c.tu = :tu
+            UNION ALL
+            SELECT DISTINCT c.rowid, CASE WHEN f.name = 'free' THEN 3 ELSE 2 END, k.rowid, c.id, CASE WHEN f.name = 'free' THEN 'Called free()' ELSE 'Function Call' END, k.id
+                FROM copies c JOIN args g ON g.tu = c.tu AND g.arg = c.id
+                JOIN calls k ON k.tu = g.tu AND k.id = g.call
+                LEFT JOIN decls f ON f.tu = k.tu AND f.id = k.callee
+                WHERE c.traceTu = :traceTu AND c.traceId = :traceId AND c.tu = :tu AND (f.name IS NULL OR f.name != 'memcpy')
+        ) ORDER BY copyOrder, kindOrder, siteOrder
+    """
 
-    # Add all the assignments to the graph as edges
+    def __init__(self, filename):
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("PRAGMA cache_size = -%d" % databaseCacheKiB)
+        self.connection.execute("PRAGMA temp_store = FILE")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(FactDatabase.schema)
+
+    def close(self):
+        self.connection.close()
+
+    def replaceUnit(self, src):
+        # The unit of src, emptied of whatever an earlier run stored for it
+        self.connection.execute("INSERT OR IGNORE INTO units(src) VALUES (?)", (src,))
+        tu = self.connection.execute("SELECT tu FROM units WHERE src = ?", (src,)).fetchone()[0]
+        for table in ["analyzed", "nodes", "vars", "assignments", "rhs", "decls", "params", "calls", "args"]:
+            self.connection.execute("DELETE FROM " + table + " WHERE tu = ?", (tu,))
+        self.connection.execute("DELETE FROM copies WHERE traceTu = ? OR tu = ?", (tu, tu))
+        return tu
+
+    def insertTranslationUnit(self, src):
+        # Replace whatever an earlier run stored for src with the facts in
+        # memory, in one transaction
+        with self.connection:
+            tu = self.replaceUnit(src)
+            self.connection.executemany("INSERT INTO analyzed VALUES (?, ?)", [(tu, file) for file in set(analyzedFiles or [src])])
+            allIds = dict.fromkeys([*Variable.allVars, *VariableAssignment.allAssignments, *FunctionDeclaration.allFuncDeclarations, *FunctionCall.allFuncCalls])
+            self.connection.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?, ?)", (
+                (tu, intId(id), node.kind if node is not None else None, getFileById(id) if id in AstNode.nodeFileIndexes else None,
+                 node.range.begin.offset if node is not None and node.range is not None and node.range.begin is not None else None)
+                for id, node in ((id, AstNode.allNodes.get(id)) for id in allIds)))
+            self.connection.executemany("INSERT INTO vars VALUES (?, ?, ?)", ((tu, intId(id), name) for id, name in Variable.allVars.items()))
+            self.connection.executemany("INSERT INTO assignments VALUES (?, ?, ?, ?)", ((tu, intId(id), intId(left), int(isInit)) for id, (left, _, isInit) in VariableAssignment.allAssignments.items()))
+            self.connection.executemany("INSERT INTO rhs VALUES (?, ?, ?, ?)", ((tu, intId(id), position, intId(var) or None) for id, (_, right, _) in VariableAssignment.allAssignments.items() for position, var in enumerate(right)))
+            self.connection.executemany("INSERT INTO decls VALUES (?, ?, ?, ?)", ((tu, intId(id), FunctionDeclaration.allFuncDeclByName[id][0], len(params)) for id, params in FunctionDeclaration.allFuncDeclarations.items()))
+            self.connection.executemany("INSERT INTO params VALUES (?, ?, ?, ?)", ((tu, intId(id), position, intId(param)) for id, params in FunctionDeclaration.allFuncDeclarations.items() for position, param in enumerate(params)))
+            self.connection.executemany("INSERT INTO calls VALUES (?, ?, ?, ?)", ((tu, intId(id), intId(callee) or None, len(args)) for id, (callee, args) in FunctionCall.allFuncCalls.items()))
+            self.connection.executemany("INSERT INTO args VALUES (?, ?, ?, ?)", ((tu, intId(id), position, intId(arg) or None) for id, (_, args) in FunctionCall.allFuncCalls.items() for position, arg in enumerate(args)))
+        return tu
+
+    def insertFactTable(self, src, facts, analyzed):
+        # insertTranslationUnit() for a fact table, straight from its columns
+        # without registering the facts first. The ids already are integers.
+        files = facts.header["files"]
+        kinds = facts.header["kinds"]
+        def listRows(ids, start, values):
+            return ((tu, id, position, value or None) for row, id in enumerate(ids) for position, value in enumerate(values[start[row]:start[row + 1]]))
+        with self.connection:
+            tu = self.replaceUnit(src)
+            self.connection.executemany("INSERT INTO analyzed VALUES (?, ?)", [(tu, file) for file in set(analyzed)])
+            self.connection.executemany("INSERT OR IGNORE INTO nodes VALUES (?, ?, ?, ?, ?)", (
+                (tu, id, kinds[kind], files[file] if file >= 0 else None, offset if offset >= 0 else None)
+                for id, kind, file, offset in zip(facts.nodeId, facts.nodeKind, facts.nodeFile, facts.nodeOffset)))
+            self.connection.executemany("INSERT OR REPLACE INTO vars VALUES (?, ?, ?)", ((tu, id, facts.string(facts.varName, row)) for row, id in enumerate(facts.varId)))
+            self.connection.executemany("INSERT OR REPLACE INTO assignments VALUES (?, ?, ?, ?)", ((tu, id, left, isInit) for id, left, isInit in zip(facts.assignId, facts.assignLeft, facts.assignInit)))
+            self.connection.executemany("INSERT INTO rhs VALUES (?, ?, ?, ?)", listRows(facts.assignId, facts.assignRightStart, facts.assignRight))
+            self.connection.executemany("INSERT OR REPLACE INTO decls VALUES (?, ?, ?, ?)", (
+                (tu, id, facts.string(facts.declName, row), facts.declParamStart[row + 1] - facts.declParamStart[row]) for row, id in enumerate(facts.declId)))
+            self.connection.executemany("INSERT INTO params VALUES (?, ?, ?, ?)", listRows(facts.declId, facts.declParamStart, facts.declParam))
+            self.connection.executemany("INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?)", (
+                (tu, id, callee or None, facts.callArgStart[row + 1] - facts.callArgStart[row]) for row, (id, callee) in enumerate(zip(facts.callId, facts.callCallee))))
+            self.connection.executemany("INSERT INTO args VALUES (?, ?, ?, ?)", listRows(facts.callId, facts.callArgStart, facts.callArg))
+        return tu
+
+    def traceCopies(self, tu, traceId):
+        # Every copy of the variable, in any unit, as (tu, hex id) in the
+        # order they were reached
+        with self.connection:
+            self.connection.execute("DELETE FROM copies WHERE traceTu = ? AND traceId = ?", (tu, intId(traceId)))
+            self.connection.execute("INSERT INTO copies " + FactDatabase.reachQuery, {"tu": tu, "id": intId(traceId)})
+        rows = self.connection.execute("SELECT tu, id FROM copies WHERE traceTu = ? AND traceId = ? ORDER BY rowid", (tu, intId(traceId)))
+        return [(copyTu, hexId(id)) for copyTu, id in rows]
+
+    def planInstrumentation(self, tu, traceId):
+        rows = self.connection.execute(FactDatabase.planQuery, {"traceTu": tu, "traceId": intId(traceId), "tu": tu})
+        return [(hexId(copy), comment, hexId(site)) for _, _, _, copy, comment, site in rows]
+
+def lastFileIn(data, file=None):
+    # The last file named in a subtree, in the order ingestion sees them, or
+    # file if it names none. clang only names a file when it changes, so this
+    # is where the next declaration carries on from. Subtrees of kinds that
+    # aren't built still name files, so every kind counts.
+    stack = [data]
+    while len(stack) > 0:
+        node = stack.pop()
+        if "loc" in node and "file" in node["loc"]:
+            file = node["loc"]["file"]
+        if "inner" in node:
+            stack.extend(reversed(node["inner"]))
+    return file
+
+def followFiles(data):
+    # Carry the current file over a subtree that's skipped instead of built
+    file = lastFileIn(data)
+    if file is not None:
+        AstNode.currentFile = file
+        AstNode.currentFileIndex = fileIndexFor(file)
+
+def scanShard(positions):
+    # The file each declaration ends on, skipped declarations up to the next
+    # one included
+    topLevel = AstNode.shardRoot.root["inner"]
+    files = []
+    for position in positions:
+        file = lastFileIn(topLevel[position])
+        position += 1
+        while position < len(topLevel) and not (len(topLevel[position]) > 0 and isRelevantKind(topLevel[position]["kind"])):
+            file = lastFileIn(topLevel[position], file)
+            position += 1
+        files.append(file)
+    return files
+
+def buildTopLevel(position, file):
+    # Build one declaration of the translation unit, starting from the file
+    # ingestion of everything before it would have ended on
+    AstNode.currentFile = file
+    AstNode.currentFileIndex = fileIndexFor(file) if file is not None else None
+    data = AstNode.shardRoot.root["inner"][position]
+    node = nodeClassForKind(data["kind"])(data, AstNode.shardRoot)
+    if lazyChildren:
+        materializeFunctions(node, functionsToAnalyze)
+    return node
+
+def climbShard(shard):
+    # Runs in a forked worker, which may have built other shards before.
+    # Registries only ever grow, so whatever lies past their lengths from
+    # before is what this shard found.
+    positions, startFiles, factsFilename = shard
+    facts = shardedFacts()
+    before = [len(f) for f in facts]
+    found = (Variable.varToTraceId, FunctionDeclaration.memcpyId, FunctionDeclaration.freeId, AstNode.firstSrcFileNode)
+    owners = {}
+    firstSrcFilePosition = None
+    nodes = []
+    for position, file in zip(positions, startFiles):
+        built = [len(f) for f in facts]
+        nodes.append(buildTopLevel(position, file))
+        for f, length in zip(facts, built):
+            for id in islice(f, length, None):
+                owners[id] = position
+        if AstNode.firstSrcFileNode is not found[3] and firstSrcFilePosition is None:
+            firstSrcFilePosition = position
+
+    # Sent back through a fact table instead of pickling the registries
+    newFacts = [dict(islice(f.items(), length, None)) for f, length in zip(facts, before)]
+    ids = [new if new != old else None for new, old in zip((Variable.varToTraceId, FunctionDeclaration.memcpyId, FunctionDeclaration.freeId), found)]
+    header = dict(zip(["varToTraceId", "memcpyId", "freeId"], ids), firstSrcFilePosition=firstSrcFilePosition)
+    if functionSummaries:
+        # Calls into other shards get no summary, including the ones of
+        # shards this worker happened to build before, or what a call comes
+        # out as would depend on how the pool hands out the shards
+        FunctionSummary.allSummaries.clear()
+        FunctionSummary.byNameAndArity.clear()
+        cached = set(FunctionSummary.cache)
+        summarizeFunctions(nodes)
+        header["summaries"] = [summary.toJson() for summary in FunctionSummary.allSummaries.values()]
+        header["summaryCache"] = {key: summary for key, summary in FunctionSummary.cache.items() if key not in cached}
+    FactTable.write(factsFilename, newFacts, owners, header)
+    return factsFilename
+
+def climbASTSharded(data):
+    # The top-level declarations of the translation unit are split into
+    # shards of consecutive ones, built by forked workers, and the facts
+    # merged back in declaration order. clang's node ids are already unique
+    # across the whole dump, so they're kept as they are. Only the
+    # declarations instrumentCode() needs get built here (see
+    # materializeShardOwners()).
+    global lazyChildren
+    lazy = lazyChildren
+    lazyChildren = True
+    try:
+        root = nodeClassForKind(data["kind"])(data, None)
+    finally:
+        lazyChildren = lazy
+    AstNode.shardRoot = root
+
+    positions = [i for i, child in enumerate(data["inner"] if "inner" in data else []) if len(child) > 0 and isRelevantKind(child["kind"])]
+    if functionSummaries:
+        loadSummaryCache()
+    shardCount = max(1, min(len(positions), shardWorkers * 8))
+    shards = [positions[len(positions) * i // shardCount:len(positions) * (i + 1) // shardCount] for i in range(shardCount)]
+    with tempfile.TemporaryDirectory() as factsDir, multiprocessing.get_context("fork").Pool(shardWorkers) as pool:
+        # Where each declaration starts depends on every one before it, so
+        # the files are found in parallel first and chained here
+        file = AstNode.currentFile
+        for skipped in islice(data.get("inner", []), positions[0] if len(positions) > 0 else 0):
+            file = lastFileIn(skipped, file)
+        for shard, lastFiles in zip(shards, pool.imap(scanShard, shards)):
+            for position, lastFile in zip(shard, lastFiles):
+                AstNode.shardStartFiles[position] = file
+                if lastFile is not None:
+                    file = lastFile
+
+        tasks = [(shard, [AstNode.shardStartFiles[p] for p in shard], os.path.join(factsDir, "shard%d.facts" % i)) for i, shard in enumerate(shards)]
+        for factsFilename in pool.imap(climbShard, tasks):
+            facts = FactTable(factsFilename)
+            for id, position in facts.merge().items():
+                AstNode.shardOwners.setdefault(id, position)
+            if AstNode.shardFirstSrcFilePosition is None:
+                AstNode.shardFirstSrcFilePosition = facts.header["firstSrcFilePosition"]
+            for summary in facts.header.get("summaries", []):
+                FunctionSummary.fromJson(summary)
+            FunctionSummary.cache.update(facts.header.get("summaryCache", {}))
+            facts.close()
+            os.remove(factsFilename)
+    if functionSummaries:
+        saveSummaryCache()
+    return root
+
+def materializeShardOwners(ids):
+    # Build the top-level declarations the given facts were found in, in the
+    # order ingestion would have built them. The first one in srcFilename is
+    # where the runtime goes.
+    positions = {AstNode.shardOwners[id] for id in ids if id in AstNode.shardOwners}
+    if AstNode.shardFirstSrcFilePosition is not None:
+        positions.add(AstNode.shardFirstSrcFilePosition)
+    global lazyChildren
+    lazy = lazyChildren
+    lazyChildren = False
+    try:
+        for position in sorted(positions - AstNode.shardBuilt):
+            buildTopLevel(position, AstNode.shardStartFiles[position])
+            AstNode.shardBuilt.add(position)
+    finally:
+        lazyChildren = lazy
+
+def climbAST(raw=None):
+    # raw is the dump of srcFilename when it's been taken already
+    if frontend == "libclang":
+        data = parseCursors()
+    else:
+        if raw is None:
+            raw = dumpAST()
+
+            # Written out as-is, re-encoding the dump costs as much as decoding it
+            with open("out.json", "wb") as dbgFile:
+                dbgFile.write(raw)
+
+        data = decodeAST(raw)
+    if shardWorkers > 1:
+        return climbASTSharded(data)
+    if headerCacheFilename is not None:
+        HeaderCache.load()
+    root = nodeClassForKind(data["kind"])(data, None)
+    if headerCacheFilename is not None:
+        stale = HeaderCache.check()
+        if len(stale) > 0:
+            # Built again from scratch, with the stale headers this time
+            print("Header cache entries out of date for " + ", ".join(stale) + ", rebuilding")
+            resetState()
+            root = nodeClassForKind(data["kind"])(data, None)
+        HeaderCache.record()
+        HeaderCache.save()
+    if lazyChildren:
+        materializeFunctions(root, functionsToAnalyze)
+    if functionSummaries:
+        loadSummaryCache()
+        summarizeFunctions([root])
+        saveSummaryCache()
+    return root
+
+def dependencyEdges():
+    # Every value flow between two variables of the analyzed files, from the
+    # variable copied to the one it's copied into
+    inAnalyzedFiles = analyzedFileMask()
+    fileOf = AstNode.nodeFileIndexes
+
+    # All the assignments
     for left, right, _ in VariableAssignment.allAssignments.values():
-        if getFileById(left) == srcFilename:
-            dependencyGraph.add_edges_from([(r, left) for r in right if r is not None and getFileById(r) == srcFilename])
-            dependencyGraphNamed.add_edges_from([(getNameIdMix(r), getNameIdMix(left)) for r in right if r is not None and getFileById(r) == srcFilename])
+        if inAnalyzedFiles[fileOf[left]]:
+            for r in right:
+                if r is not None and inAnalyzedFiles[fileOf[r]]:
+                    yield r, left
 
-    # Add all the function calls to the graph as edges
+    # All the function calls
     for funcId, args in FunctionCall.allFuncCalls.values():
         params = FunctionDeclaration.allFuncDeclarations[funcId]
         if len(params) == len(args):
@@ -1242,32 +2806,266 @@ def buildDependencyGraph():
             # and malloc() maybe something to do with sizeof() but all other important functions
             # are coming out alright
             for i in range(len(args)):
-                if args[i] is not None and getFileById(args[i]) == getFileById(params[i]) == srcFilename:
-                    dependencyGraph.add_edge(args[i], params[i])
-                    dependencyGraphNamed.add_edge(getNameIdMix(args[i]), getNameIdMix(params[i]))
-
-    # Add all the deep copies from calls of memcpy
-    memcpyCalls = [fc for fc in FunctionCall.allFuncCalls.values() if fc[0] == FunctionDeclaration.memcpyId]
-    for call in memcpyCalls:
+                if args[i] is not None and inAnalyzedFiles[fileOf[args[i]]] and inAnalyzedFiles[fileOf[params[i]]]:
+                    yield args[i], params[i]
+
+    # Stitch the calls of summarized functions: arguments reach the other
+    # arguments, the globals and the call result their parameter reaches.
+    # These come on top of the edges above rather than replacing them: the
+    # copies inside a callee's body get instrumented too, so its body and
+    # the argument to parameter edges into it have to stay in the graph.
+    # What summaries add is the flows those edges miss, out through return
+    # values and into other arguments, and a cache that spares
+    # re-summarizing unchanged functions.
+    if functionSummaries:
+        for callId, (funcId, args) in FunctionCall.allFuncCalls.items():
+            # The call facts flatten the arguments, the call itself doesn't
+            # when it's been built
+            args = callArguments(AstNode.allNodes[callId]) if callId in AstNode.allNodes else [[arg] for arg in args]
+            summary = FunctionSummary.forCall(funcId, len(args))
+            if summary is None or len(summary.params) != len(args):
+                continue
+            for k, arg in enumerate(args):
+                reached = [dst for j in summary.params[k] for dst in args[j]] + summary.globals[k] + ([callId] if summary.returns[k] and callId in Variable.allVars else [])
+                for src in arg:
+                    if src is None or not inAnalyzedFiles[fileOf[src]]:
+                        continue
+                    for dst in reached:
+                        if dst is not None and dst in fileOf and inAnalyzedFiles[fileOf[dst]]:
+                            yield src, dst
+
+    # All the deep copies from calls of memcpy
+    memcpyCalls = [(id, fc) for id, fc in FunctionCall.allFuncCalls.items() if fc[0] == FunctionDeclaration.memcpyId]
+    for callId, call in memcpyCalls:
         dst = call[1][0]
         src = call[1][1]
-        if dst is not None and src is not None and getFileById(dst) == getFileById(src) == srcFilename:
-            dependencyGraph.add_edge(src, dst)
-            dependencyGraphNamed.add_edge(getNameIdMix(src), getNameIdMix(dst))
+        if dst is not None and src is not None and inAnalyzedFiles[fileOf[dst]] and inAnalyzedFiles[fileOf[src]]:
+            if findings is not None:
+                findings.emit("memcpy-edge", "memcpy() copies " + getNameIdMix(src) + " into " + getNameIdMix(dst), nodeLocation(callId), src=Variable.allVars.get(src), dst=Variable.allVars.get(dst), id=callId)
+            yield src, dst
+
+class GraphExport:
+    # The edges of the dependency graph written as they go by, without the
+    # graph: CSV rows of ids and names, GraphML nodes on first sight and
+    # edges, or an (n, 2) NumPy array of integer ids (see intId()) kept as
+    # two flat columns until it's saved
+    formats = {".csv": "csv", ".npy": "npy", ".graphml": "graphml"}
+
+    def __init__(self, filename, format=None):
+        self.filename = filename
+        self.format = format or GraphExport.formats.get(os.path.splitext(filename)[1], "csv")
+        self.edges = 0
+        if self.format == "npy":
+            self.columns = array("q")
+            return
+        self.file = open(filename, "w", newline="")
+        if self.format == "csv":
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(["src", "dst", "srcName", "dstName"])
+        else:
+            self.seen = set()
+            self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+                            '<key id="name" for="node" attr.name="name" attr.type="string"/>\n<graph edgedefault="directed">\n')
+
+    def add(self, src, dst):
+        self.edges += 1
+        if self.format == "npy":
+            self.columns.extend((intId(src), intId(dst)))
+        elif self.format == "csv":
+            self.writer.writerow([src, dst, Variable.allVars.get(src), Variable.allVars.get(dst)])
+        else:
+            for id in (src, dst):
+                if id not in self.seen:
+                    self.seen.add(id)
+                    self.file.write('<node id=%s><data key="name">%s</data></node>\n' % (quoteattr(id), escape(str(Variable.allVars.get(id)))))
+            self.file.write("<edge source=%s target=%s/>\n" % (quoteattr(src), quoteattr(dst)))
+
+    def close(self):
+        if self.format == "npy":
+            np.save(self.filename, np.frombuffer(self.columns, dtype=np.int64).reshape(-1, 2))
+            return
+        if self.format == "graphml":
+            self.file.write("</graph>\n</graphml>\n")
+        self.file.close()
+
+def exportedEdges():
+    # dependencyEdges(), written to graphExportFilename on the way if it's set
+    if graphExportFilename is None:
+        yield from dependencyEdges()
+        return
+    export = GraphExport(graphExportFilename, graphExportFormat)
+    try:
+        for src, dst in dependencyEdges():
+            export.add(src, dst)
+            yield src, dst
+    finally:
+        export.close()
+
+def neighborhoodCenters(graph):
+    if neighborhoodCenter is None:
+        return [Variable.varToTraceId] if Variable.varToTraceId in graph else []
+    if neighborhoodCenter.startswith("free:"):
+        line = int(neighborhoodCenter[len("free:"):])
+        files = set(analyzedFiles or [srcFilename])
+        return [arg for callId, (callee, args) in FunctionCall.allFuncCalls.items() if callee is not None and callee == FunctionDeclaration.freeId
+                for arg in args if arg in graph and nodeLocation(callId)[1] == line and nodeLocation(callId)[0] in files]
+    return [id for id in graph if id == neighborhoodCenter or Variable.allVars.get(id) == neighborhoodCenter]
+
+def drawDependencyGraph(graph):
+    # Into drawFilename, the neighborhood only if there's a neighborhoodHops
+    centers = neighborhoodCenters(graph)
+    if neighborhoodHops is not None:
+        undirected = graph.to_undirected(as_view=True)
+        nodes = set()
+        for center in centers:
+            nodes.update(nx.single_source_shortest_path_length(undirected, center, cutoff=neighborhoodHops))
+        graph = graph.subgraph(nodes)
+    if len(graph) == 0:
+        print("Nothing to draw around " + str(neighborhoodCenter or varToTrace))
+        return
+    if len(graph) > drawNodeLimit:
+        print("Not drawing %d nodes, more than %d: export the graph or draw a neighborhood with fewer hops" % (len(graph), drawNodeLimit))
+        return
+    named = nx.relabel_nodes(graph, getNameIdMix)
+    plt.figure(figsize=(12, 9))
+    pos = nx.spring_layout(named, seed=1111)
+    nx.draw(named, with_labels=True, pos=pos, font_size=8, node_color=["tab:red" if id in centers else "tab:blue" for id in graph])
+    plt.savefig(drawFilename)
+    plt.close()
+
+def buildDependencyGraph():
+    dependencyGraph = nx.DiGraph()
+    for src, dst in exportedEdges():
+        dependencyGraph.add_edge(src, dst)
 
     # Calculate all the nodes that can be reached
     allCopiesSet = nx.shortest_path(dependencyGraph, Variable.varToTraceId).keys()
-    allCopiesSetNamed = nx.shortest_path(dependencyGraphNamed, getNameIdMix(Variable.varToTraceId)).keys()
-    
-    pos = nx.spring_layout(dependencyGraphNamed, seed=1111)
-    nx.draw(dependencyGraphNamed, with_labels=True, pos=pos)
-    # plt.show()
-
+    if drawFilename is not None:
+        drawDependencyGraph(dependencyGraph)
     return allCopiesSet
 
+class AliasSets:
+    # Union-find over variable ids: every flow merges the sets of both ends,
+    # no matter its direction, so a set holds everything that may alias
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, id):
+        if id not in self.parent:
+            self.parent[id] = id
+            self.size[id] = 1
+            return id
+        parent = self.parent
+        while parent[id] != id:
+            parent[id] = parent[parent[id]]
+            id = parent[id]
+        return id
+
+    def union(self, a, b):
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return a
+
+    def members(self, id):
+        root = self.find(id)
+        return [other for other in self.parent if self.find(other) == root]
+
+def unifyAliases():
+    # A conservative superset of what buildDependencyGraph() finds, in
+    # almost linear time
+    aliases = AliasSets()
+    aliases.find(Variable.varToTraceId)
+    graph = nx.DiGraph() if drawFilename is not None else None
+    for src, dst in exportedEdges():
+        aliases.union(src, dst)
+        if graph is not None:
+            graph.add_edge(src, dst)
+    if graph is not None:
+        drawDependencyGraph(graph)
+    return aliases.members(Variable.varToTraceId)
+
+def findCopies():
+    if aliasMode == "unify":
+        return unifyAliases()
+    return buildDependencyGraph()
+
+class InsertionPoints:
+    # Where code can go around a node: before and after it, before a
+    # CompoundStmt meaning where its first statement starts. Worked out once
+    # for a whole function (see index()).
+    def __init__(self, before, after):
+        self.before = before
+        self.after = after
+
+    @staticmethod
+    def of(node):
+        if node.insertionPoints is None:
+            unit = node
+            while unit.parent is not None and unit.kind != "FunctionDecl":
+                unit = unit.parent
+            InsertionPoints.index(unit if unit.kind == "FunctionDecl" else node)
+        return node.insertionPoints
+
+    @staticmethod
+    def index(unit):
+        # Children before their parents, a block starts where its first
+        # statement does and an if-statement ends in its blocks
+        order = []
+        stack = [unit]
+        while len(stack) > 0:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(node.inner)
+        for node in reversed(order):
+            node.insertionPoints = InsertionPoints.compute(node)
+
+    @staticmethod
+    def compute(node):
+        begin = []
+        end = []
+        if node.range is not None:
+            if node.range.begin is not None and node.range.begin.offset is not None:
+                begin = [node.range.begin.offset]
+            if node.range.end is not None and node.range.end.offset is not None and node.range.end.tokLen is not None:
+                end = [node.range.end.offset + node.range.end.tokLen]
+
+        if node.kind == "CompoundStmt":
+            # Right behind the left brace would be the beginning otherwise
+            entry = InsertionPoints.beforeChild(node.inner[0]) if len(node.inner) > 0 else []
+            return InsertionPoints(entry, end)
+        if node.kind == "IfStmt":
+            # The end of an if-statement is the start of its blocks, and right
+            # after the block when there's no else
+            after = []
+            for child in node.inner:
+                if child.kind == "CompoundStmt":
+                    after += child.insertionPoints.before
+                    if node.hasElse is None:
+                        after += child.insertionPoints.after
+            return InsertionPoints(begin, after)
+        return InsertionPoints(begin, end)
+
+    @staticmethod
+    def beforeChild(child):
+        if child.parentFlowControlNode is not None:
+            flowControl = child.parentFlowControlNode.range
+            return [flowControl.begin.offset] if flowControl is not None and flowControl.begin is not None and flowControl.begin.offset is not None else []
+        return child.insertionPoints.before
+
 class FuncInstrumentation:
-    def __init__(self, location, funcName, params, semiColonPrefix=False, semiColonPostfix=False, newLineBefore=True, indentation=16, comment="", newLineAfter=True):
+    def __init__(self, location, funcName, params, semiColonPrefix=False, semiColonPostfix=False, newLineBefore=True, indentation=16, comment="", newLineAfter=True, varId=None, node=None):
         self.location = location
+        # The variable passed and the statement being instrumented, only
+        # needed by optimizeInstrumentation()
+        self.varId = varId
+        self.node = node
         self.funcName = funcName
         self.params = params
         self.semiColonPrefix = semiColonPrefix
@@ -1303,99 +3101,1659 @@ class InstrumentationDirect:
     def __str__(self):
         return self.str
 
-def instrumentCode(allCopiesSet):
+regionKinds     = ["CompoundStmt", "IfStmt", "ForStmt", "WhileStmt", "DoStmt", "SwitchStmt", "CaseStmt", "DefaultStmt"]
+loopKinds       = ["ForStmt", "WhileStmt", "DoStmt"]
+jumpTargetKinds = ["LabelStmt", "CaseStmt", "DefaultStmt"]
+
+def nodeExtent(node):
+    # Offsets of the first character of a node and of the one past its end
+    if node.range is None or node.range.begin is None or node.range.end is None:
+        return None
+    begin  = node.range.begin.offset
+    end    = node.range.end.offset
+    tokLen = node.range.end.tokLen
+    if begin is None or end is None or tokLen is None:
+        return None
+    return (begin, end + tokLen)
+
+def referencedVariable(node):
+    # The variable an lvalue expression names directly, if it does
+    while node.kind in ["ParenExpr", "ImplicitCastExpr"] and len(node.inner) > 0:
+        node = node.inner[0]
+    if node.kind == "DeclRefExpr" and node.referencedDecl is not None:
+        return node.referencedDecl.id
+    return None
+
+def mutatedVariable(node):
+    # The variable whose value a node changes, or whose address escapes
+    if node.kind == "VarDecl":
+        return node.id
+    if node.kind == "BinaryOperator" and node.opcode == "=" or node.kind == "CompoundAssignOperator":
+        return referencedVariable(node.inner[0]) if len(node.inner) > 0 else None
+    if node.kind == "UnaryOperator" and node.opcode in ["++", "--", "&"]:
+        return referencedVariable(node.inner[0]) if len(node.inner) > 0 else None
+    return None
+
+class FunctionLayout:
+    # Where the regions, jump targets and variable mutations of a function
+    # are, by offset
+    allLayouts = {}
+
+    def __init__(self, function):
+        self.regions = []
+        self.jumpTargets = []
+        self.mutations = {}
+        stack = [function]
+        while len(stack) > 0:
+            node = stack.pop()
+            stack.extend(node.inner)
+            extent = nodeExtent(node)
+            if extent is None:
+                continue
+            if node.kind in regionKinds:
+                self.regions.append((extent[0], extent[1], node))
+            if node.kind in jumpTargetKinds:
+                self.jumpTargets.append(extent[0])
+            varId = mutatedVariable(node)
+            if varId is not None:
+                self.mutations.setdefault(varId, []).append(extent[0])
+
+    @staticmethod
+    def of(node):
+        while node is not None and node.kind != "FunctionDecl":
+            node = node.parent
+        if node is None:
+            return None
+        if node.id not in FunctionLayout.allLayouts:
+            FunctionLayout.allLayouts[node.id] = FunctionLayout(node)
+        return FunctionLayout.allLayouts[node.id]
+
+    def innermostRegion(self, location):
+        inside = [r for r in self.regions if r[0] < location < r[1]]
+        return min(inside, key=lambda r: r[1] - r[0]) if len(inside) > 0 else None
+
+    def isMutatedIn(self, varId, begin, end):
+        return any(begin <= m < end for m in self.mutations.get(varId, []))
+
+def loopBody(loop):
+    children = loop.inner
+    if len(children) == 0:
+        return None
+    body = children[0] if loop.kind == "DoStmt" else children[-1]
+    return body if body.kind == "CompoundStmt" else None
+
+def hoistInstrumentation(instrumentation):
+    # Move a registration in front of the outermost enclosing loops that
+    # never change the variable
+    layout = FunctionLayout.of(instrumentation.node)
+    if layout is None:
+        return instrumentation
+    location = instrumentation.location
+    hoistedOutOf = None
+    loop = instrumentation.node.parent
+    while loop is not None and loop.kind != "FunctionDecl":
+        if loop.kind in loopKinds:
+            body = loopBody(loop)
+            bodyExtent = nodeExtent(body) if body is not None else None
+            loopExtent = nodeExtent(loop)
+            if bodyExtent is None or loopExtent is None or not bodyExtent[0] < location < bodyExtent[1]:
+                break
+            # Only in front of whole statements, never as the body of an if
+            if loop.parent is None or loop.parent.kind != "CompoundStmt":
+                break
+            if layout.isMutatedIn(instrumentation.varId, loopExtent[0], loopExtent[1]):
+                break
+            hoistedOutOf = loop
+            location = loopExtent[0]
+        loop = loop.parent
+    if hoistedOutOf is None:
+        return instrumentation
+    return FuncInstrumentation(location=location, funcName=instrumentation.funcName, params=instrumentation.params, indentation=0, semiColonPostfix=True, newLineBefore=False, newLineAfter=False, comment=instrumentation.comment + ", hoisted out of loop", varId=instrumentation.varId, node=hoistedOutOf)
+
+def dominates(earlier, later):
+    # Whether every path reaching later has gone through earlier without the
+    # variable changing in between
+    layout = FunctionLayout.of(earlier.node)
+    if layout is None or layout is not FunctionLayout.of(later.node) or earlier.location > later.location:
+        return False
+    region = layout.innermostRegion(earlier.location)
+    if region is None or region[2].kind != "CompoundStmt" or not region[0] < later.location < region[1]:
+        return False
+    if any(earlier.location < target <= later.location for target in layout.jumpTargets):
+        return False
+    if layout.isMutatedIn(later.varId, earlier.location + 1, later.location):
+        return False
+    # Loops around later but not around earlier bring mutations from anywhere
+    # in their body back around
+    for begin, end, node in layout.regions:
+        if node.kind in loopKinds and begin < later.location < end and not begin < earlier.location < end:
+            if layout.isMutatedIn(later.varId, begin, end):
+                return False
+    return True
+
+def optimizeInstrumentation(instrumentations):
+    registrations = [i for i in instrumentations if isinstance(i, FuncInstrumentation) and i.funcName == "__AddAddress" and i.node is not None]
+    registered = set(map(id, registrations))
+    others = [i for i in instrumentations if id(i) not in registered]
+
+    registrations = [hoistInstrumentation(r) for r in registrations]
+    registrations.sort(key=lambda r: r.location)
+    kept = {}
+    for registration in registrations:
+        key = (registration.varId, tuple(registration.params))
+        if not any(dominates(k, registration) for k in kept.get(key, [])):
+            kept.setdefault(key, []).append(registration)
+    return others + [r for registrations in kept.values() for r in registrations]
+
+# The runtime injected into instrumented files. Registered addresses go into
+# an open-addressing set (linear probing, tombstones for removed entries)
+# behind a spinlock. Each thread remembers the last address it registered,
+# so registering the same pointer again, which is what most instrumented
+# loops do, skips the lock entirely. Removals bump a generation counter that
+# invalidates those per-thread entries. The wiping check only looks at
+# registered blocks and scans them a word at a time.
+runtimeTemplate = r"""
+
+#include <stdint.h>
+#include <stdio.h>
+#include <string.h>
+#if defined(__GLIBC__) || defined(__linux__)
+#include <malloc.h>
+#define __AST_CLIMBER_BLOCK_SIZE(addr) malloc_usable_size(addr)
+#elif defined(__APPLE__)
+#include <malloc/malloc.h>
+#define __AST_CLIMBER_BLOCK_SIZE(addr) malloc_size(addr)
+#else
+#define __AST_CLIMBER_BLOCK_SIZE(addr) ((size_t)0)
+#endif
+
+#ifndef __AST_CLIMBER_CAPACITY
+#define __AST_CLIMBER_CAPACITY @CAPACITY@
+#endif
+#define __AST_CLIMBER_TOMBSTONE ((void*)1)
+
+static void* __astClimberSlots[__AST_CLIMBER_CAPACITY];
+static void* __astClimberScratch[__AST_CLIMBER_CAPACITY];
+static size_t __astClimberLive;
+static size_t __astClimberUsed;
+static unsigned long __astClimberGeneration;
+static char __astClimberLock;
+static __thread void* __astClimberLastAdded;
+static __thread unsigned long __astClimberLastGeneration;
+
+static size_t __astClimberHash(void* addr) {
+    uint64_t h = (uint64_t)(uintptr_t)addr;
+    h ^= h >> 33;
+    h *= 0xff51afd7ed558ccdULL;
+    h ^= h >> 33;
+    return (size_t)h & (__AST_CLIMBER_CAPACITY - 1);
+}
 
-    allInstrumentationLocations = []
-    for copyId in allCopiesSet:
-        # If this variable isn't a function parameter, instrument its initialization with __AddAddress()
-        node = AstNode.allNodes[copyId]
-        if node.kind == "VarDecl" and node.hasInitialization is True:
-            locations = node.findInstrumentationLocations(instBeginning=False, instEnding=True)
-            funcName = "__AddAddress"
-            params = [getNameById(node.id)]
-            for location in locations:
-                newInstrumentation = FuncInstrumentation(location=location, funcName=funcName, params=params, semiColonPrefix=True, newLineAfter=False, comment="Initialization")
-                allInstrumentationLocations.append(newInstrumentation)
-
-        # Instrument all assignments of variables that are not initializations
-        shallowCopyIds = [k for k,v in VariableAssignment.allAssignments.items() if v[0] == copyId and not v[2]]
-        for shallowCopyId in shallowCopyIds:
-            shallowCopyNode = AstNode.allNodes[shallowCopyId]
-            locations = shallowCopyNode.findInstrumentationLocations(instBeginning=False, instEnding=True)
-            funcName = "__AddAddress"
-            params = [getNameById(node.id)]
-            for location in locations:
-                newInstrumentation = FuncInstrumentation(location=location, funcName=funcName, params=params, semiColonPrefix=True, newLineAfter=False, comment="Assignment")
-                allInstrumentationLocations.append(newInstrumentation)
-
-        # Instrument all non-memcpy, non-free function calls that use the variable as an argument
-        ignoredIds = [FunctionDeclaration.memcpyId, FunctionDeclaration.freeId]
-        funcCallIds = [id for id, info in FunctionCall.allFuncCalls.items() if info[0] not in ignoredIds and copyId in info[1]]
-        for funcCallId in funcCallIds:
-            funcCallNode = AstNode.allNodes[funcCallId]
-            locations = funcCallNode.findInstrumentationLocations(instBeginning=False, instEnding=True)
-            funcName = "__AddAddress"
-            params = [getNameById(node.id)]
-            semiColonPrefix = True
-            semiColonPostfix = False
-            # If this is going to be put in/around a compoundstmt block
-            # reverse the semicolon position
-            if funcCallNode.parentFlowControlNode is not None:
-                semiColonPrefix = False
-                semiColonPostfix = True
-            for location in locations:
-                newInstrumentation = FuncInstrumentation(location=location, funcName=funcName, params=params, semiColonPrefix=semiColonPrefix, semiColonPostfix=semiColonPostfix, newLineAfter=False, comment="Function Call")
-                allInstrumentationLocations.append(newInstrumentation)
-
-        # Instrument all instances of free on the variable
-        freeCallIds = [id for id, info in FunctionCall.allFuncCalls.items() if info[0] == FunctionDeclaration.freeId and copyId in info[1]]
-        for freeCallId in freeCallIds:
-            freeCallNode = AstNode.allNodes[freeCallId]
-            locations = freeCallNode.findInstrumentationLocations(instBeginning=True, instEnding=False)
-            funcName = "__MemoryWipingCheck"
-            params = [getNameById(node.id)]
-            for location in locations:
-                newInstrumentation = FuncInstrumentation(location=location, funcName=funcName, params=params, indentation=0, semiColonPostfix=True, newLineBefore=False, comment="Called free()")
-                allInstrumentationLocations.append(newInstrumentation)
+static void __astClimberAcquire(void) {
+    while (__atomic_test_and_set(&__astClimberLock, __ATOMIC_ACQUIRE)) {
+    }
+}
 
-    # Finally, add the definitions of the implementation functions
-    addAddressImpl = """
+static void __astClimberRelease(void) {
+    __atomic_clear(&__astClimberLock, __ATOMIC_RELEASE);
+}
 
-    void __AddAddress(void* addr) {
-        /* Function body goes here */
+/* Rehashes the live entries to get rid of the tombstones, lock held */
+static void __astClimberPurge(void) {
+    size_t i;
+    memcpy(__astClimberScratch, __astClimberSlots, sizeof(__astClimberSlots));
+    memset(__astClimberSlots, 0, sizeof(__astClimberSlots));
+    for (i = 0; i < __AST_CLIMBER_CAPACITY; i++) {
+        void* addr = __astClimberScratch[i];
+        if (addr != NULL && addr != __AST_CLIMBER_TOMBSTONE) {
+            size_t slot = __astClimberHash(addr);
+            while (__astClimberSlots[slot] != NULL) {
+                slot = (slot + 1) & (__AST_CLIMBER_CAPACITY - 1);
+            }
+            __astClimberSlots[slot] = addr;
+        }
     }
+    __astClimberUsed = __astClimberLive;
+}
 
-    """
+__attribute__((weak)) void __AddAddress(void* addr) {
+    size_t slot;
+    size_t firstFree = (size_t)-1;
+    unsigned long generation = __atomic_load_n(&__astClimberGeneration, __ATOMIC_ACQUIRE);
+    if (addr == NULL || (addr == __astClimberLastAdded && generation == __astClimberLastGeneration)) {
+        return;
+    }
 
-    memoryWipingCheckImpl = """
-    
-    void __MemoryWipingCheck(void* addr) {
-        /* Function body goes here */
+    __astClimberAcquire();
+    if (__astClimberUsed >= __AST_CLIMBER_CAPACITY / 4 * 3) {
+        __astClimberPurge();
+    }
+    for (slot = __astClimberHash(addr); __astClimberSlots[slot] != NULL; slot = (slot + 1) & (__AST_CLIMBER_CAPACITY - 1)) {
+        if (__astClimberSlots[slot] == addr) {
+            firstFree = slot;
+            break;
+        }
+        if (__astClimberSlots[slot] == __AST_CLIMBER_TOMBSTONE && firstFree == (size_t)-1) {
+            firstFree = slot;
+        }
+    }
+    if (firstFree == (size_t)-1 || __astClimberSlots[firstFree] != addr) {
+        if (__astClimberLive >= __AST_CLIMBER_CAPACITY / 4 * 3) {
+            __astClimberRelease();
+            fprintf(stderr, "__AddAddress: address set is full, raise __AST_CLIMBER_CAPACITY\n");
+            return;
+        }
+        if (firstFree == (size_t)-1) {
+            firstFree = slot;
+            __astClimberUsed++;
+        }
+        __astClimberSlots[firstFree] = addr;
+        __astClimberLive++;
     }
+    __astClimberRelease();
 
-    """
+    __astClimberLastAdded = addr;
+    __astClimberLastGeneration = generation;
+}
+
+__attribute__((weak)) void __MemoryWipingCheck(void* addr) {
+    size_t slot;
+    size_t size;
+    size_t i;
+    int registered = 0;
+    const unsigned char* bytes = (const unsigned char*)addr;
+    if (addr == NULL) {
+        return;
+    }
+
+    __astClimberAcquire();
+    for (slot = __astClimberHash(addr); __astClimberSlots[slot] != NULL; slot = (slot + 1) & (__AST_CLIMBER_CAPACITY - 1)) {
+        if (__astClimberSlots[slot] == addr) {
+            __astClimberSlots[slot] = __AST_CLIMBER_TOMBSTONE;
+            __astClimberLive--;
+            __atomic_add_fetch(&__astClimberGeneration, 1, __ATOMIC_RELEASE);
+            registered = 1;
+            break;
+        }
+    }
+    __astClimberRelease();
+    if (!registered) {
+        return;
+    }
+
+    /* malloc() hands out blocks aligned for any word, so no unaligned head */
+    size = __AST_CLIMBER_BLOCK_SIZE(addr);
+    for (i = 0; i + sizeof(uintptr_t) <= size; i += sizeof(uintptr_t)) {
+        uintptr_t word;
+        memcpy(&word, bytes + i, sizeof(word));
+        if (word != 0) {
+            break;
+        }
+    }
+    for (; i < size; i++) {
+        if (bytes[i] != 0) {
+            fprintf(stderr, "__MemoryWipingCheck: %p is freed without being wiped (byte %lu of %lu is set)\n", addr, (unsigned long)i, (unsigned long)size);
+            return;
+        }
+    }
+}
+
+#ifdef __AST_CLIMBER_PROFILE
+/* Count the hits of every call written after this point. A site is the n-th
+   such call, numbered in the order instrumentCode() returns them */
+#include <stdlib.h>
+#define __AST_CLIMBER_SITES @SITES@
+enum { __astClimberSiteBase = __COUNTER__ + 1 };
+static unsigned long __astClimberSiteHits[__AST_CLIMBER_SITES + 1];
+
+static void __astClimberDumpProfile(void) {
+    const char* path = getenv("AST_CLIMBER_PROFILE");
+    FILE* out = path != NULL ? fopen(path, "w") : stderr;
+    int site;
+    if (out == NULL) {
+        return;
+    }
+    for (site = 0; site < __AST_CLIMBER_SITES; site++) {
+        fprintf(out, "%d %lu\n", site, __atomic_load_n(&__astClimberSiteHits[site], __ATOMIC_RELAXED));
+    }
+    if (out != stderr) {
+        fclose(out);
+    }
+}
+
+static void __attribute__((constructor)) __astClimberRegisterProfile(void) {
+    atexit(__astClimberDumpProfile);
+}
+
+static inline int __astClimberHit(int site) {
+    /* Sites past the known ones all land in the spare last slot */
+    if (site < 0 || site > __AST_CLIMBER_SITES) {
+        site = __AST_CLIMBER_SITES;
+    }
+    __atomic_fetch_add(&__astClimberSiteHits[site], 1, __ATOMIC_RELAXED);
+    return 0;
+}
+
+/* A macro doesn't expand inside itself, so these still call the functions */
+#define __AddAddress(addr) (__astClimberHit(__COUNTER__ - __astClimberSiteBase), __AddAddress(addr))
+#define __MemoryWipingCheck(addr) (__astClimberHit(__COUNTER__ - __astClimberSiteBase), __MemoryWipingCheck(addr))
+#endif
+
+"""
+
+def runtimeImplementation(capacity=None, sites=0):
+    return runtimeTemplate.replace("@CAPACITY@", str(capacity if capacity is not None else runtimeCapacity)).replace("@SITES@", str(sites))
+
+class FindingsWriter:
+    # Writes findings out as each step of the analysis produces them, one
+    # JSON object per line or as the results of a SARIF log, flushed after
+    # each one so aggregators can follow the file while it's written:
+    # memcpy() edges while the graph is built, the copies once the trace is
+    # done and the free() checks while instrumenting. Nothing is kept in
+    # memory. Written to stdout, everything else printed goes to stderr
+    # until it's closed, so the output stays a valid document.
+    rules = {
+        "traced-copy"          : "A copy of the traced variable",
+        "memory-wiping-check"  : "A free() of a copy, checked by __MemoryWipingCheck()",
+        "memcpy-edge"          : "A memcpy() copying one variable into another"
+    }
 
+    def __init__(self, filename, format=None):
+        self.format = format or ("sarif" if filename.endswith(".sarif") else "jsonl")
+        self.savedStdout = sys.stdout
+        self.file = sys.stdout if filename == "-" else open(filename, "w")
+        if filename == "-":
+            sys.stdout = sys.stderr
+        self.count = 0
+        if self.format == "sarif":
+            driver = {"name": "AST-Climber", "rules": [{"id": id, "shortDescription": {"text": text}} for id, text in FindingsWriter.rules.items()]}
+            self.file.write('{"version": "2.1.0", "$schema": "https://json.schemastore.org/sarif-2.1.0.json", "runs": [{"tool": {"driver": ' + json.dumps(driver) + '}, "results": [\n')
+
+    def close(self):
+        if self.format == "sarif":
+            self.file.write("\n]}]}\n")
+        sys.stdout = self.savedStdout
+        if self.file is self.savedStdout:
+            self.file.flush()
+        else:
+            self.file.close()
+
+    def emit(self, rule, message, location, **properties):
+        file, line, col = location
+        if self.format == "sarif":
+            physical = {"artifactLocation": {"uri": file}}
+            if line is not None:
+                physical["region"] = {"startLine": line, "startColumn": col}
+            finding = {"ruleId": rule, "level": "note", "message": {"text": message}, "locations": [{"physicalLocation": physical}], "properties": properties}
+            self.file.write((",\n" if self.count > 0 else "") + json.dumps(finding))
+        else:
+            self.file.write(json.dumps(dict(rule=rule, message=message, file=file, line=line, col=col, **properties)) + "\n")
+        self.file.flush()
+        self.count += 1
+
+lineStarts = {}
+
+def sourceLocation(file, offset):
+    # Line and column, both from 1, of an offset into a file
+    if file not in lineStarts:
+        try:
+            with open(file, "rb") as sourceFile:
+                data = sourceFile.read()
+        except OSError:
+            data = None
+        starts = None
+        if data is not None:
+            starts = [0]
+            end = data.find(b"\n")
+            while end >= 0:
+                starts.append(end + 1)
+                end = data.find(b"\n", end + 1)
+        lineStarts[file] = starts
+    if lineStarts[file] is None or offset is None:
+        return None, None
+    line = bisect.bisect_right(lineStarts[file], offset)
+    return line, offset - lineStarts[file][line - 1] + 1
+
+def nodeLocation(id):
+    # (file, line, column) of a fact, without line and column for nodes that
+    # were never built
+    index = AstNode.nodeFileIndexes.get(id)
+    file = AstNode.fileNames[index] if index is not None else None
+    node = AstNode.allNodes.get(id)
+    offset = None
+    if node is not None:
+        if node.loc is not None and node.loc.offset is not None:
+            offset = node.loc.offset
+        elif node.range is not None and node.range.begin is not None:
+            offset = node.range.begin.offset
+    return (file,) + (sourceLocation(file, offset) if file is not None else (None, None))
+
+def reportCopies(allCopiesSet):
+    if findings is None:
+        return
+    if AstNode.shardRoot is not None:
+        materializeShardOwners(allCopiesSet)
+    for copyId in allCopiesSet:
+        findings.emit("traced-copy", getNameIdMix(copyId) + " holds a copy of " + str(varToTrace), nodeLocation(copyId), variable=Variable.allVars.get(copyId), id=copyId)
+
+def planInstrumentation(allCopiesSet):
+    # What gets instrumented for each copy, as (copy, comment, statement id):
+    # initializations, other assignments of the copy, the calls it's passed
+    # to and the calls of free() on it
+    plan = []
+    ignoredIds = [FunctionDeclaration.memcpyId, FunctionDeclaration.freeId]
+    for copyId in allCopiesSet:
+        # Only a VarDecl registers an initialization under its own id
+        if copyId in VariableAssignment.allAssignments and VariableAssignment.allAssignments[copyId][2]:
+            plan.append((copyId, "Initialization", copyId))
+        plan += [(copyId, "Assignment", id) for id, info in VariableAssignment.allAssignments.items() if info[0] == copyId and not info[2]]
+        plan += [(copyId, "Function Call", id) for id, info in FunctionCall.allFuncCalls.items() if info[0] not in ignoredIds and copyId in info[1]]
+        plan += [(copyId, "Called free()", id) for id, info in FunctionCall.allFuncCalls.items() if info[0] == FunctionDeclaration.freeId and copyId in info[1]]
+    return plan
+
+def instrumentCode(allCopiesSet, plan=None, mode=None):
+    # Returns the instrumentation sites in the order of the instrumented file,
+    # as (function, params, comment, line in srcFilename)
+    source, edits, sites = renderInstrumentation(allCopiesSet, plan)
+    for filename, data in instrumentationOutputs(source, edits, mode):
+        writeIfChanged(filename, data)
+    return sites
+
+def applyEdits(source, edits):
+    pieces = []
+    last = 0
+    for offset, text in edits:
+        pieces.append(source[last:offset])
+        pieces.append(text)
+        last = offset
+    pieces.append(source[last:])
+    return "".join(pieces)
+
+def instrumentationOutputs(source, edits, mode=None):
+    # The files written for srcFilename in outputMode, as (filename, content).
+    # The diff and the edits apply to srcFilename itself: the edits are byte
+    # offsets into it, with the SHA-1 of its bytes. Like the source, the
+    # contents hold one character per byte (see writeIfChanged()).
+    mode = mode or outputMode
+    if mode == "file":
+        return [(instFilename, applyEdits(source, edits))]
+    base = os.path.splitext(instFilename)[0]
+    if mode == "diff":
+        diff = difflib.unified_diff(source.splitlines(True), applyEdits(source, edits).splitlines(True), srcFilename, srcFilename)
+        return [(base + ".diff", "".join(diff))]
+    edits = {"source": srcFilename, "sha1": hashlib.sha1(source.encode("latin-1")).hexdigest(), "edits": edits}
+    return [(base + ".edits.json", json.dumps(edits))]
+
+def writeIfChanged(filename, data):
+    # Leaves a file that already has this content alone, modification time
+    # included, so builds depending on it don't rerun. data holds a byte per
+    # character, the way renderInstrumentation() reads the source.
+    data = data.encode("latin-1")
+    try:
+        with open(filename, "rb") as existingFile:
+            if hashlib.sha1(existingFile.read()).digest() == hashlib.sha1(data).digest():
+                return False
+    except OSError:
+        pass
+    with open(filename, "wb") as outputFile:
+        outputFile.write(data)
+    return True
+
+def renderInstrumentation(allCopiesSet, plan=None):
+    # The source, the edits instrumenting it in the order they go in, as
+    # (offset, text), and the sites, see instrumentCode()
+    if plan is None:
+        plan = planInstrumentation(allCopiesSet)
+
+    if AstNode.shardRoot is not None:
+        materializeShardOwners({copyId for copyId, _, _ in plan} | {id for _, _, id in plan})
+
+    allInstrumentationLocations = []
+    for copyId, comment, id in plan:
+        node = AstNode.allNodes[id]
+        params = [getNameById(copyId)]
+        if comment == "Called free()":
+            locations = node.findInstrumentationLocations(instBeginning=True, instEnding=False)
+            options = dict(funcName="__MemoryWipingCheck", indentation=0, semiColonPostfix=True, newLineBefore=False)
+        elif comment == "Function Call" and node.parentFlowControlNode is not None:
+            # If this is going to be put in/around a compoundstmt block
+            # reverse the semicolon position
+            locations = node.findInstrumentationLocations(instBeginning=False, instEnding=True)
+            options = dict(funcName="__AddAddress", semiColonPostfix=True, newLineAfter=False)
+        else:
+            locations = node.findInstrumentationLocations(instBeginning=False, instEnding=True)
+            options = dict(funcName="__AddAddress", semiColonPrefix=True, newLineAfter=False)
+        for location in locations:
+            allInstrumentationLocations.append(FuncInstrumentation(location=location, params=params, comment=comment, varId=copyId, node=node, **options))
+
+    if elideInstrumentation:
+        allInstrumentationLocations = optimizeInstrumentation(allInstrumentationLocations)
+    if findings is not None:
+        for i in allInstrumentationLocations:
+            if i.funcName == "__MemoryWipingCheck":
+                findings.emit("memory-wiping-check", "free() of " + getNameIdMix(i.varId) + " is checked by __MemoryWipingCheck()", nodeLocation(i.node.id), variable=Variable.allVars.get(i.varId), id=i.node.id)
+
+    # Finally, add the definitions of the implementation functions
     location = AstNode.firstSrcFileNode.findInstrumentationLocations(True, False)
-    allInstrumentationLocations.append(InstrumentationDirect(location[0], addAddressImpl))
-    allInstrumentationLocations.append(InstrumentationDirect(location[0], memoryWipingCheckImpl))
+    siteCount = len(allInstrumentationLocations)
+    allInstrumentationLocations.append(InstrumentationDirect(location[0], runtimeImplementation(sites=siteCount)))
             
     # Sort the instrumentations in reverse order
     allInstrumentationLocations.sort(reverse=True, key=lambda i: i.location)
 
-    # Read in the data from the source file
-    sourceFile = open(srcFilename, "r")
-    data = sourceFile.read()
+    # Read in the data from the source file. clang's offsets count bytes, so
+    # it's decoded one character per byte and without translating newlines.
+    sourceFile = open(srcFilename, "rb")
+    data = sourceFile.read().decode("latin-1")
     sourceFile.close()
 
-    # Perform all the instrumentations
-    for instrumentation in allInstrumentationLocations:
-        data = data[:instrumentation.location] + str(instrumentation) + data[instrumentation.location:]
+    # Instrumentations at the same location end up in the file in the reverse
+    # order they are inserted in
+    sites = [(i.funcName, i.params, i.comment, data.count("\n", 0, i.location) + 1) for i in reversed(allInstrumentationLocations) if isinstance(i, FuncInstrumentation)]
+
+    edits = [(i.location, str(i)) for i in reversed(allInstrumentationLocations)]
+    return data, edits, sites
+
+def benchmarkDecoders(dumpFilename=None, repeat=5):
+    if dumpFilename is None:
+        raw = dumpAST()
+    else:
+        with open(dumpFilename, "rb") as dumpFile:
+            raw = dumpFile.read()
+    print("Dump size: %.1f MB" % (len(raw) / 1e6))
+    print("%-10s %12s %12s %16s" % ("backend", "decode (ms)", "ingest (ms)", "decode peak (MB)"))
+
+    backends = [b for b, module in [("json", json), ("orjson", orjson), ("simdjson", simdjson)] if module is not None]
+    for backend in backends:
+        decodeTimes = []
+        ingestTimes = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = decodeAST(raw, backend)
+            decoded = time.perf_counter()
+            resetState()
+            nodeClassForKind(data["kind"])(data, None)
+            ingested = time.perf_counter()
+            decodeTimes.append(decoded - start)
+            ingestTimes.append(ingested - decoded)
+            data = None
+
+        # Only allocations made through Python's allocator are seen here, so
+        # the buffers simdjson keeps outside of the heap don't show up
+        resetState()
+        tracemalloc.start()
+        data = decodeAST(raw, backend)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        data = None
+
+        print("%-10s %12.1f %12.1f %16.1f" % (backend, min(decodeTimes) * 1e3, min(ingestTimes) * 1e3, peak / 1e6))
+
+runtimeBenchmarkMain = r"""
+#include <stdlib.h>
+#include <time.h>
+
+static double benchmarkNow(void) {
+    struct timespec t;
+    clock_gettime(CLOCK_MONOTONIC, &t);
+    return t.tv_sec * 1e9 + t.tv_nsec;
+}
 
-    instFilename = "example_inst.cc"
-    with open(instFilename, "w") as instrumentedFile:
-        instrumentedFile.write(data)
+int main(int argc, char** argv) {
+    enum { BLOCKS = 1024, BLOCK_SIZE = 64, WIPED_SIZE = 1 << 16 };
+    long calls = argc > 1 ? atol(argv[1]) : 10000000;
+    long wipes = calls / 1000 + 1;
+    char* blocks[BLOCKS];
+    char* wiped = (char*)calloc(1, WIPED_SIZE);
+    double start, sameAddress, distinctAddresses, wipingChecks;
+    long i;
+    for (i = 0; i < BLOCKS; i++) {
+        blocks[i] = (char*)calloc(1, BLOCK_SIZE);
+    }
+
+    start = benchmarkNow();
+    for (i = 0; i < calls; i++) {
+        __AddAddress(blocks[0]);
+    }
+    sameAddress = benchmarkNow();
+    for (i = 0; i < calls; i++) {
+        __AddAddress(blocks[i % BLOCKS]);
+    }
+    distinctAddresses = benchmarkNow();
+    for (i = 0; i < wipes; i++) {
+        __AddAddress(wiped);
+        __MemoryWipingCheck(wiped);
+    }
+    wipingChecks = benchmarkNow();
+
+    printf("__AddAddress, same address          %8.2f ns/call\n", (sameAddress - start) / calls);
+    printf("__AddAddress, %d distinct addresses %8.2f ns/call\n", BLOCKS, (distinctAddresses - sameAddress) / calls);
+    printf("__MemoryWipingCheck, %d byte block %8.2f ns/call\n", WIPED_SIZE, (wipingChecks - distinctAddresses) / wipes);
+    return 0;
+}
+"""
+
+def benchmarkRuntime(calls=10000000):
+    # The instrumented file has to build and run against the runtime, the
+    # per-call overhead is measured on the runtime alone
+    if not os.path.exists(instFilename):
+        climbAST()
+        instrumentCode(buildDependencyGraph())
+    with tempfile.TemporaryDirectory() as buildDir:
+        instBinary = os.path.join(buildDir, "instrumented")
+        r = subprocess.run(["clang", "-O2", "-o", instBinary] + clangArgs + [instFilename], stderr=subprocess.PIPE, text=True)
+        if r.returncode != 0:
+            print("Couldn't compile " + instFilename + ":")
+            print(r.stderr)
+            return
+        r = subprocess.run([instBinary], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        print(instFilename + " exited with " + str(r.returncode))
+        if len(r.stderr) > 0:
+            print(r.stderr, end="")
+
+        benchSource = os.path.join(buildDir, "runtime_benchmark.c")
+        benchBinary = os.path.join(buildDir, "runtime_benchmark")
+        with open(benchSource, "w") as benchFile:
+            benchFile.write(runtimeImplementation() + runtimeBenchmarkMain)
+        r = subprocess.run(["clang", "-O2", "-x", "c", "-o", benchBinary, benchSource], stderr=subprocess.PIPE, text=True)
+        if r.returncode != 0:
+            print("Couldn't compile the runtime benchmark:")
+            print(r.stderr)
+            return
+        subprocess.run([benchBinary, str(calls)])
+
+def benchmarkFrontends(repeat=5):
+    # With --pch the JSON frontend runs with and without the precompiled
+    # header, the difference is clang's time on the headers saved
+    global frontend, pchInUse
+    selected = (frontend, pchInUse)
+    configurations = [("json", "json", None)] + ([("json+pch", "json", pchInUse)] if pchInUse is not None else []) + ([("libclang", "libclang", None)] if clang is not None else [])
+    print("%-10s %12s %12s %12s %8s %8s  %s" % ("frontend", "best (ms)", "mean (ms)", "peak (MB)", "assigns", "calls", "copies"))
+    try:
+        for label, frontend, pchInUse in configurations:
+            times = []
+            for _ in range(repeat):
+                resetState()
+                start = time.perf_counter()
+                climbAST()
+                times.append(time.perf_counter() - start)
+
+            resetState()
+            tracemalloc.start()
+            climbAST()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            # Both frontends have to come up with the same facts for the file
+            assignments = [a for a in VariableAssignment.allAssignments.values() if getFileById(a[0]) == srcFilename]
+            calls = [id for id in FunctionCall.allFuncCalls if getFileById(id) == srcFilename]
+            copies = sorted(getNameById(id) for id in buildDependencyGraph())
+            print("%-10s %12.1f %12.1f %12.1f %8d %8d  %s" % (label, min(times) * 1e3, sum(times) / len(times) * 1e3, peak / 1e6, len(assignments), len(calls), ",".join(copies)))
+    finally:
+        frontend, pchInUse = selected
+
+def generateSyntheticSource(filename, functions=10):
+    # A chain of functions passing copies of the traced buffer on to each
+    # other, main() runs it as many rounds as its first argument says
+    # Callees come first, the call of a prototype doesn't reach the
+    # parameters of its definition
+    lines = ["#include <cstdio>", "#include <cstdlib>", "#include <cstring>", "", "char* lastBuffer;"]
+    for i in reversed(range(functions)):
+        lines += ["", "unsigned long stage_%d(char* buffer, int round) {" % i, "    unsigned long sum = 0;"]
+        if i % 2 == 0:
+            lines += ["    char* cursor = buffer;"]
+        else:
+            lines += ["    char* cursor;", "    cursor = buffer;"]
+        if i % 3 == 0:
+            lines += ["    lastBuffer = cursor;"]
+        lines += ["    for (int i = 0; i < 64; i++) {", "        sum += cursor[i] ^ round;", "    }", "    cursor[round % 64] = (char)sum;"]
+        if i + 1 < functions:
+            lines += ["    sum += stage_%d(buffer, round);" % (i + 1)]
+        lines += ["    return sum;", "}"]
+    lines += ["", "int main(int argc, char** argv) {",
+              "    int rounds = argc > 1 ? atoi(argv[1]) : 100000;",
+              "    char* %s = (char*)malloc(64);" % varToTrace,
+              "    memset(%s, 1, 64);" % varToTrace,
+              "    unsigned long total = 0;",
+              "    for (int round = 0; round < rounds; round++) {",
+              "        total += stage_0(%s, round);" % varToTrace,
+              "    }",
+              "    printf(\"%lu\\n\", total);",
+              "    memset(%s, 0, 64);" % varToTrace,
+              "    free(%s);" % varToTrace,
+              "    return 0;",
+              "}", ""]
+    with open(filename, "w") as syntheticFile:
+        syntheticFile.write("\n".join(lines))
+
+def runWorkload(binary, workloadArgs, workloadInput, repeat, env=None):
+    # Best wall time of a few runs, the binary's output is thrown away
+    times = []
+    for _ in range(repeat):
+        stdin = open(workloadInput, "rb") if workloadInput is not None else subprocess.DEVNULL
+        start = time.perf_counter()
+        subprocess.run([binary] + workloadArgs, stdin=stdin, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+        times.append(time.perf_counter() - start)
+        if workloadInput is not None:
+            stdin.close()
+    return min(times)
+
+def benchmarkOverhead(syntheticFunctions=[], workloadArgs=[], workloadInput=None, repeat=5):
+    # Compare srcFilename and the synthetic sources with their instrumented
+    # versions: run time, binary size and how often each site is hit
+    global srcFilename, instFilename
+    selected = (srcFilename, instFilename)
+    try:
+        with tempfile.TemporaryDirectory() as buildDir:
+            sources = [srcFilename]
+            for functions in syntheticFunctions:
+                sources.append(os.path.join(buildDir, "synthetic_%d.cc" % functions))
+                generateSyntheticSource(sources[-1], functions)
+
+            for source in sources:
+                srcFilename = source
+                base, extension = os.path.splitext(os.path.basename(source))
+                instFilename = os.path.join(buildDir, base + "_inst" + extension)
+                resetState()
+                climbAST()
+                sites = instrumentCode(buildDependencyGraph(), mode="file")
+
+                binaries = {}
+                builds = [("original", source, []), ("instrumented", instFilename, []), ("profile", instFilename, ["-D__AST_CLIMBER_PROFILE"])]
+                for build, filename, defines in builds:
+                    binaries[build] = os.path.join(buildDir, base + "_" + build)
+                    r = subprocess.run(["clang", "-O2", "-o", binaries[build]] + defines + clangArgs + [filename], stderr=subprocess.PIPE, text=True)
+                    if r.returncode != 0:
+                        print("Couldn't compile " + filename + ":")
+                        print(r.stderr)
+                        break
+                else:
+                    original = runWorkload(binaries["original"], workloadArgs, workloadInput, repeat)
+                    instrumented = runWorkload(binaries["instrumented"], workloadArgs, workloadInput, repeat)
+                    originalSize = os.path.getsize(binaries["original"])
+                    instrumentedSize = os.path.getsize(binaries["instrumented"])
+
+                    profileFilename = os.path.join(buildDir, base + ".profile")
+                    runWorkload(binaries["profile"], workloadArgs, workloadInput, 1, dict(os.environ, AST_CLIMBER_PROFILE=profileFilename))
+                    hits = {}
+                    if os.path.exists(profileFilename):
+                        with open(profileFilename) as profileFile:
+                            hits = dict(map(int, line.split()) for line in profileFile)
+
+                    print(os.path.basename(source))
+                    print("  %-12s %10.2f ms %10d bytes" % ("original", original * 1e3, originalSize))
+                    print("  %-12s %10.2f ms %10d bytes   %+.1f%%   %+d bytes" % ("instrumented", instrumented * 1e3, instrumentedSize, (instrumented / original - 1) * 100, instrumentedSize - originalSize))
+                    print("  %4s %6s %10s  %s" % ("site", "line", "hits", "call"))
+                    for site, (funcName, params, comment, line) in enumerate(sites):
+                        print("  %4d %6d %10d  %s(%s) /* %s */" % (site, line, hits.get(site, 0), funcName, ",".join(params), comment))
+    finally:
+        srcFilename, instFilename = selected
+
+def goldenCopies(copies):
+    # Ids change with every dump, names and positions don't
+    if AstNode.shardRoot is not None:
+        materializeShardOwners(copies)
+    return sorted([Variable.allVars.get(copyId)] + list(nodeLocation(copyId)[1:]) for copyId in copies)
+
+def regressionRun(raw, measureMemory=False):
+    # One pass of the engine that's set up over a dump, the seconds and the
+    # peak traced bytes of each phase with what it produced. Memory of the
+    # --jobs workers isn't traced. With a databaseFilename the copies are
+    # traced and planned in a fresh database.
+    seconds = {}
+    peaks = {}
+    resetState()
+    FunctionSummary.cache = {}
+    if measureMemory:
+        tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        climbAST(raw)
+        seconds["climb"] = time.perf_counter() - start
+        if measureMemory:
+            peaks["climb"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        plan = None
+        if databaseFilename is not None:
+            if os.path.exists(databaseFilename):
+                os.remove(databaseFilename)
+            database = FactDatabase(databaseFilename)
+            tu = database.insertTranslationUnit(srcFilename)
+            copies = [id for copyTu, id in database.traceCopies(tu, Variable.varToTraceId) if copyTu == tu]
+            plan = database.planInstrumentation(tu, Variable.varToTraceId)
+            database.close()
+        else:
+            copies = list(findCopies())
+        seconds["trace"] = time.perf_counter() - start
+        if measureMemory:
+            peaks["trace"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        source, edits, sites = renderInstrumentation(copies, plan)
+        instrumented = instrumentationOutputs(source, edits, "file")[0][1]
+        seconds["instrument"] = time.perf_counter() - start
+        if measureMemory:
+            peaks["instrument"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        if measureMemory:
+            tracemalloc.stop()
+    return seconds, peaks, goldenCopies(copies), instrumented
+
+async def analyzePipelined(sources):
+    # runPipeline()'s dump and analyze stages, with the results kept instead
+    # of written, as (source, outputs, copies), and why units were skipped
+    run = BatchRun(sources)
+    dumped = asyncio.Queue(pipelineDepth)
+    analyzed = asyncio.Queue(pipelineDepth)
+    results = []
+    async def collect():
+        while True:
+            item = await analyzed.get()
+            if item is None:
+                return
+            results.append(item)
+    await asyncio.gather(dumpStage(run, dumped, StageMetrics("dump")), analyzeStage(run, dumped, analyzed, StageMetrics("analyze")), collect())
+    return results, run.skipped
+
+def regressionPipelineRun(measureMemory=False):
+    # regressionRun() through the pipeline, which dumps on its own and does
+    # all the phases of a unit in one go
+    if measureMemory:
+        tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        results, skipped = asyncio.run(analyzePipelined([srcFilename]))
+        seconds = {"analyze": time.perf_counter() - start}
+        peaks = {"analyze": tracemalloc.get_traced_memory()[1]} if measureMemory else {}
+    finally:
+        if measureMemory:
+            tracemalloc.stop()
+    if len(results) == 0:
+        raise DumpFailed("%s: %s" % (srcFilename, skipped.get(srcFilename)))
+    _, outputs, copies = results[0]
+    return seconds, peaks, goldenCopies(copies), outputs[0][1]
+
+def regress(updateGolden=False, repeat=3):
+    # Run every case of the corpus through every engine, comparing the copies
+    # and the instrumented source with the golden ones and the fastest of
+    # repeat runs of each phase with its budget. An engine is the settings
+    # it runs with, plus "golden": "own" for one compared with golden files
+    # of its own and "run": "pipeline" for one going through the pipeline.
+    # Files the settings name are made in a scratch directory. With
+    # updateGolden the first engine, and every one with golden files of its
+    # own, writes them instead. clang's arguments from the command line come
+    # after each case's own. Returns whether all passed.
+    global srcFilename, instFilename, varToTrace, clangArgs, analyzedFiles, pchInUse
+    extraArgs = clangArgs
+    with open(os.path.join(regressionDirectory, "cases.json")) as casesFile:
+        corpus = json.load(casesFile)
+    goldenDirectory = os.path.join(regressionDirectory, "golden")
+    os.makedirs(goldenDirectory, exist_ok=True)
+    failures = []
+    column = lambda seconds: "%9.3f" % seconds if seconds is not None else "%9s" % "-"
+    print("%-10s %-10s %9s %9s %9s %9s %10s" % ("case", "engine", "dump (s)", "climb (s)", "trace (s)", "inst (s)", "peak (MB)"))
+    with tempfile.TemporaryDirectory() as scratchDirectory:
+        for case in corpus["cases"]:
+            budgets = dict(corpus["budgets"], **case.get("budgets", {}))
+            srcFilename = os.path.normpath(os.path.join(regressionDirectory, case["source"]))
+            instFilename = instFilenameFor(srcFilename)
+            varToTrace = case.get("trace", "X")
+            clangArgs = case.get("args", []) + extraArgs
+            analyzedFiles = []
+            sharedDump = None
+
+            for position, (engine, options) in enumerate(corpus["engines"].items()):
+                label = "%s/%s" % (case["name"], engine)
+                settings = {name: os.path.join(scratchDirectory, value) if name.endswith("Filename") else value for name, value in options.items() if name not in ["golden", "run"]}
+                if settings.get("frontend") == "libclang" and clang is None:
+                    print("%-10s %-10s skipped, no clang.cindex" % (case["name"], engine))
+                    continue
+                goldenName = case["name"] + ("." + engine if options.get("golden") == "own" else "")
+                copiesFilename = os.path.join(goldenDirectory, goldenName + ".copies.json")
+                instrumentedFilename = os.path.join(goldenDirectory, goldenName + "_inst" + os.path.splitext(srcFilename)[1])
+                saved = {name: globals()[name] for name in settings}
+                globals().update(settings)
+                try:
+                    # libclang parses in climbAST() and the pipeline dumps
+                    # on its own. The other engines share one dump, but a
+                    # precompiled header makes for a dump of its own.
+                    raw = None
+                    dumpSeconds = None
+                    if options.get("run") != "pipeline" and frontend != "libclang":
+                        if pchFilename is not None:
+                            preparePch([srcFilename])
+                        if pchFilename is not None or sharedDump is None:
+                            start = time.perf_counter()
+                            raw = dumpAST()
+                            dumpSeconds = time.perf_counter() - start
+                            if dumpSeconds > budgets["dump"]:
+                                failures.append("%s: dump took %.2f s, budget %g s" % (label, dumpSeconds, budgets["dump"]))
+                            if pchFilename is None:
+                                sharedDump = (raw, dumpSeconds)
+                        else:
+                            raw, dumpSeconds = sharedDump
+                    if options.get("run") == "pipeline":
+                        runs = [regressionPipelineRun() for _ in range(repeat)]
+                        _, peaks, copies, instrumented = regressionPipelineRun(measureMemory=True)
+                    else:
+                        runs = [regressionRun(raw) for _ in range(repeat)]
+                        _, peaks, copies, instrumented = regressionRun(raw, measureMemory=True)
+                except Exception as error:
+                    failures.append("%s: %s: %s" % (label, type(error).__name__, error))
+                    continue
+                finally:
+                    globals().update(saved)
+                    pchInUse = None
+                seconds = {phase: min(run[0][phase] for run in runs) for phase in runs[0][0]}
+                peak = max(peaks.values())
+                print("%-10s %-10s %s %s %s %s %10.1f" % (case["name"], engine, column(dumpSeconds), column(seconds.get("climb", seconds.get("analyze"))), column(seconds.get("trace")), column(seconds.get("instrument")), peak / 1e6))
+
+                if updateGolden and (position == 0 or options.get("golden") == "own"):
+                    with open(copiesFilename, "w") as copiesFile:
+                        json.dump(copies, copiesFile, indent=1)
+                    with open(instrumentedFilename, "w", encoding="latin-1", newline="") as instrumentedFile:
+                        instrumentedFile.write(instrumented)
+                if not os.path.exists(copiesFilename) or not os.path.exists(instrumentedFilename):
+                    failures.append("%s: no golden files, regress --update-golden writes them" % label)
+                    continue
+                with open(copiesFilename) as copiesFile:
+                    golden = json.load(copiesFile)
+                with open(instrumentedFilename, encoding="latin-1", newline="") as instrumentedFile:
+                    goldenInstrumented = instrumentedFile.read()
+
+                if copies != golden:
+                    missing = [copy for copy in golden if copy not in copies]
+                    extra = [copy for copy in copies if copy not in golden]
+                    failures.append("%s: copies differ, missing %s, extra %s" % (label, missing, extra))
+                if instrumented != goldenInstrumented:
+                    diff = difflib.unified_diff(goldenInstrumented.splitlines(True), instrumented.splitlines(True), instrumentedFilename, label, n=1)
+                    failures.append("%s: instrumented source differs\n%s" % (label, "".join(islice(diff, 20)).rstrip()))
+                for phase, phaseSeconds in seconds.items():
+                    if phaseSeconds > budgets[phase]:
+                        failures.append("%s: %s took %.3f s, budget %g s" % (label, phase, phaseSeconds, budgets[phase]))
+                if peak > budgets["memoryMB"] * 1e6:
+                    failures.append("%s: peak of %.1f MB, budget %g MB" % (label, peak / 1e6, budgets["memoryMB"]))
+
+    for failure in failures:
+        print("FAIL " + failure)
+    print("%d cases, %d engines, %d failures" % (len(corpus["cases"]), len(corpus["engines"]), len(failures)))
+    return len(failures) == 0
+
+class FileWatcher:
+    # Waits for changes to a set of files. inotify watches their directories,
+    # since editors often save by renaming a new file over the old one, and
+    # modification times are polled where the C library doesn't have it.
+    inotifyEvents = 0x8 | 0x80 | 0x100 | 0x200  # IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self):
+        self.files = set()
+        self.directories = {}
+        self.mtimes = {}
+        self.fd = None
+        libcName = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(libcName, use_errno=True) if libcName is not None else None
+        if libc is not None and hasattr(libc, "inotify_init1"):
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                self.libc = libc
+                self.fd = fd
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def watch(self, files):
+        self.files = {os.path.abspath(file) for file in files}
+        self.mtimes = {file: self.mtime(file) for file in self.files}
+        if self.fd is None:
+            return
+        for directory in {os.path.dirname(file) for file in self.files} - set(self.directories.values()):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), FileWatcher.inotifyEvents)
+            if wd >= 0:
+                self.directories[wd] = directory
+
+    @staticmethod
+    def mtime(file):
+        try:
+            return os.stat(file).st_mtime_ns
+        except OSError:
+            return None
+
+    def changes(self, timeout=None):
+        # The watched files changed within timeout seconds, forever if None
+        if self.fd is None:
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            while True:
+                changed = {file for file in self.files if self.mtime(file) != self.mtimes[file]}
+                if len(changed) > 0 or deadline is not None and time.monotonic() >= deadline:
+                    for file in changed:
+                        self.mtimes[file] = self.mtime(file)
+                    return changed
+                time.sleep(watchPollInterval if deadline is None else max(0, min(watchPollInterval, deadline - time.monotonic())))
+
+        changed = set()
+        if len(select.select([self.fd], [], [], timeout)[0]) == 0:
+            return changed
+        try:
+            events = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(events):
+            wd, mask, cookie, length = struct.unpack_from("iIII", events, offset)
+            name = events[offset + 16:offset + 16 + length].rstrip(b"\0")
+            offset += 16 + length
+            if wd in self.directories:
+                file = os.path.join(self.directories[wd], os.fsdecode(name))
+                if file in self.files:
+                    changed.add(file)
+        return changed
+
+    def wait(self):
+        # Block for a change, then take every other one coming in until it's
+        # been quiet for watchDebounce
+        changed = set()
+        while len(changed) == 0:
+            changed = self.changes()
+        while True:
+            more = self.changes(watchDebounce)
+            if len(more) == 0:
+                return changed
+            changed |= more
+
+def projectFiles():
+    # srcFilename and the headers next to it or below, leaving out the
+    # system ones
+    root = os.path.dirname(os.path.abspath(srcFilename))
+    files = {os.path.abspath(srcFilename)}
+    for file in AstNode.fileNames:
+        if file is not None and not file.startswith("<"):
+            path = os.path.abspath(file)
+            if os.path.commonpath([root, path]) == root and os.path.exists(path):
+                files.add(path)
+    return files
+
+def instrumentOnce():
+    # One cycle of the whole pipeline, the seconds it took and the copies found
+    start = time.perf_counter()
+    resetState()
+    climbAST()
+    copies = findCopies()
+    instrumentCode(copies)
+    return time.perf_counter() - start, len(copies)
+
+def watchSource():
+    # Re-instrument srcFilename whenever it or one of its project headers is
+    # saved. Everything imported and the function summaries (by content, so
+    # mostly those of the unchanged headers) stay warm between cycles.
+    watcher = FileWatcher()
+    print("Watching " + srcFilename + (" with inotify" if watcher.fd is not None else " by polling"))
+    try:
+        while True:
+            try:
+                latency, copies = instrumentOnce()
+                print("%s: %d copies, %s in %.0f ms" % (time.strftime("%H:%M:%S"), copies, instFilename, latency * 1e3))
+            except Exception as error:
+                # A half-saved file shouldn't end the session
+                print("%s: %s: %s" % (time.strftime("%H:%M:%S"), type(error).__name__, error))
+            watcher.watch(projectFiles())
+            changed = watcher.wait()
+            print(", ".join(sorted(os.path.relpath(file) for file in changed)) + " changed")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+def instFilenameFor(source):
+    base, extension = os.path.splitext(source)
+    return base + "_inst" + extension
+
+class StageMetrics:
+    # Where the time of one pipeline stage goes: doing its work, waiting for
+    # the stage before it and blocked on a full queue to the one after it
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+
+    async def get(self, queue):
+        start = time.perf_counter()
+        item = await queue.get()
+        self.starved += time.perf_counter() - start
+        return item
+
+    async def put(self, queue, item):
+        start = time.perf_counter()
+        await queue.put(item)
+        self.blocked += time.perf_counter() - start
+
+    async def run(self, work, *args):
+        # Work that blocks goes to a thread, the event loop keeps streaming
+        # the other stages meanwhile
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, work, *args)
+        finally:
+            self.busy += time.perf_counter() - start
+            self.items += 1
+
+class BatchRun:
+    # What a pipelined run over many translation units keeps per unit: the
+    # seconds of work each stage put into it, when it was dispatched and how
+    # long it took to come out, and why it was skipped if it was. The costs
+    # are kept in historyFilename for the next run's scheduling.
+    def __init__(self, sources):
+        self.history = {}
+        if historyFilename is not None and os.path.exists(historyFilename):
+            with open(historyFilename) as historyFile:
+                self.history = json.load(historyFile)
+        self.costs = {}
+        self.dispatched = {}
+        self.latencies = {}
+        self.skipped = {}
+        # Largest first, so the biggest units don't start last and stretch
+        # the end of the run
+        self.sources = sorted(sources, key=self.estimateCost, reverse=True)
+
+    def estimateCost(self, source):
+        # Seconds a unit is expected to take: what it took last time, or a
+        # guess from its size and the headers it includes, which clang
+        # parses along with it
+        if source in self.history:
+            return self.history[source]
+        try:
+            with open(source, "rb") as sourceFile:
+                data = sourceFile.read()
+        except OSError:
+            return 0.0
+        includes = sum(1 for line in data.splitlines() if line.lstrip().startswith(b"#include"))
+        return len(data) * estimatedSecondsPerByte + includes * estimatedSecondsPerInclude
+
+    def charge(self, source, seconds):
+        self.costs[source] = self.costs.get(source, 0.0) + seconds
+
+    def skip(self, source, reason):
+        self.skipped[source] = reason
+        print("%s: skipped, %s" % (source, reason))
+
+    def save(self):
+        if historyFilename is not None:
+            self.history.update(self.costs)
+            with open(historyFilename, "w") as historyFile:
+                json.dump(self.history, historyFile)
+
+    def report(self):
+        latencies = sorted(self.latencies.values())
+        if len(latencies) > 0:
+            percentile = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+            print("  latency  p50 %.0f ms  p90 %.0f ms  p99 %.0f ms  max %.0f ms" % (percentile(0.5) * 1e3, percentile(0.9) * 1e3, percentile(0.99) * 1e3, latencies[-1] * 1e3))
+            # Buckets doubling from 1 ms
+            buckets = {}
+            for latency in latencies:
+                bucket = 0
+                while 2 ** bucket < latency * 1e3:
+                    bucket += 1
+                buckets[bucket] = buckets.get(bucket, 0) + 1
+            for bucket in range(min(buckets), max(buckets) + 1):
+                count = buckets.get(bucket, 0)
+                print("  %8s ms %5d %s" % ("<= %d" % 2 ** bucket, count, "#" * max(1 if count > 0 else 0, count * 40 // len(latencies))))
+        for source, reason in self.skipped.items():
+            print("  skipped %s: %s" % (source, reason))
+
+def limitClangMemory():
+    # Runs in the forked clang before it starts
+    if memoryLimit is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memoryLimit * 1024 * 1024, memoryLimit * 1024 * 1024))
+
+async def dumpSource(source):
+    # One try at the dump of a unit, None and why if it failed
+    process = await asyncio.create_subprocess_exec(*dumpCommand(source), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, start_new_session=True, **clangLimits())
+    chunks = []
+    async def read():
+        while True:
+            chunk = await process.stdout.read(1024 * 1024)
+            if len(chunk) == 0:
+                break
+            chunks.append(chunk)
+        await process.wait()
+    try:
+        await asyncio.wait_for(read(), clangTimeout)
+    except asyncio.TimeoutError:
+        # clang may be a driver with the compiler still running under it
+        os.killpg(process.pid, signal.SIGKILL)
+        await process.wait()
+        return None, "clang took longer than %g s" % clangTimeout
+    return dumpOutcome(b"".join(chunks), process.returncode)
+
+async def dumpStage(run, output, metrics):
+    for source in run.sources:
+        run.dispatched[source] = time.perf_counter()
+        raw = None
+        if frontend != "libclang":
+            start = time.perf_counter()
+            for attempt in range(dumpRetries + 1):
+                raw, reason = await dumpSource(source)
+                if raw is not None:
+                    break
+            metrics.busy += time.perf_counter() - start
+            run.charge(source, time.perf_counter() - start)
+            if raw is None:
+                run.skip(source, reason)
+                continue
+            if memoryLimit is not None and len(raw) * dumpMemoryFactor > memoryLimit * 1024 * 1024:
+                run.skip(source, "a dump of %d MiB won't decode within %d MiB" % (len(raw) // (1024 * 1024), memoryLimit))
+                continue
+        metrics.items += 1
+        await metrics.put(output, (source, raw))
+    await output.put(None)
+
+def analyzeTranslationUnit(source, raw):
+    # Everything between the dump and the instrumented source of one
+    # translation unit. The registries are shared, so only one runs at a
+    # time.
+    global srcFilename, instFilename
+    srcFilename = source
+    instFilename = instFilenameFor(source)
+    resetState()
+    if raw is None and frontend != "libclang":
+        # Dumped here, climbAST() would leave its debug copy of the dump in
+        # whatever directory the unit is analyzed from
+        raw = dumpAST()
+    climbAST(raw)
+    # A unit without the variable still has facts for other units to trace
+    # through
+    copies = list(findCopies()) if Variable.varToTraceId is not None else []
+    reportCopies(copies)
+    source, edits, sites = renderInstrumentation(copies)
+    return instrumentationOutputs(source, edits), copies
+
+def writeInstrumented(outputs):
+    # The files that changed
+    return [filename for filename, data in outputs if writeIfChanged(filename, data)]
+
+async def analyzeStage(run, input, output, metrics):
+    while True:
+        item = await metrics.get(input)
+        if item is None:
+            await output.put(None)
+            return
+        source = item[0]
+        start = time.perf_counter()
+        try:
+            result = await metrics.run(analyzeTranslationUnit, *item)
+        except Exception as error:
+            # One unit clang accepted but the analysis can't handle
+            run.skip(source, "%s: %s" % (type(error).__name__, error))
+            continue
+        finally:
+            run.charge(source, time.perf_counter() - start)
+        await metrics.put(output, (source,) + result)
+
+async def writeStage(run, input, metrics):
+    while True:
+        item = await metrics.get(input)
+        if item is None:
+            return
+        source, outputs, copies = item
+        start = time.perf_counter()
+        changed = await metrics.run(writeInstrumented, outputs)
+        run.charge(source, time.perf_counter() - start)
+        run.latencies[source] = time.perf_counter() - run.dispatched[source]
+        print("%s: %d copies%s" % (", ".join(filename for filename, _ in outputs), len(copies), "" if len(changed) > 0 else ", unchanged"))
+
+async def runPipeline(sources):
+    # Dump, analyze and write overlap across translation units: clang dumps
+    # the next one while one is analyzed and the one before is written. The
+    # bounded queues hold back the stages in front of the slowest one.
+    run = BatchRun(sources)
+    dumped = asyncio.Queue(pipelineDepth)
+    analyzed = asyncio.Queue(pipelineDepth)
+    metrics = [StageMetrics("dump"), StageMetrics("analyze"), StageMetrics("write")]
+    start = time.perf_counter()
+    await asyncio.gather(dumpStage(run, dumped, metrics[0]), analyzeStage(run, dumped, analyzed, metrics[1]), writeStage(run, analyzed, metrics[2]))
+    wall = time.perf_counter() - start
+    run.save()
+
+    print("%d translation units in %.2f s, %d skipped" % (len(sources), wall, len(run.skipped)))
+    print("  %-8s %6s %8s %8s %8s" % ("stage", "items", "busy", "starved", "blocked"))
+    for stage in metrics:
+        print("  %-8s %6d %7.1f%% %7.1f%% %7.1f%%" % (stage.name, stage.items, stage.busy / wall * 100, stage.starved / wall * 100, stage.blocked / wall * 100))
+    run.report()
+
+def compileCommands(filename):
+    # The entries of a compilation database as (source, directory, clang
+    # arguments), sources made absolute and what only matters to compiling
+    # them dropped from the arguments
+    with open(filename) as commandsFile:
+        entries = json.load(commandsFile)
+    commands = []
+    for entry in entries:
+        directory = os.path.abspath(entry["directory"])
+        source = os.path.normpath(os.path.join(directory, entry["file"]))
+        arguments = entry["arguments"] if "arguments" in entry else shlex.split(entry["command"])
+        args = []
+        skipNext = False
+        for argument in arguments[1:]:
+            if skipNext:
+                skipNext = False
+            elif argument in ["-o", "-MF", "-MT", "-MQ"]:
+                skipNext = True
+            elif argument in ["-c", "-MD", "-MMD"] or argument.startswith("-o") and len(argument) > 2:
+                pass
+            elif os.path.normpath(os.path.join(directory, argument)) != source:
+                args.append(argument)
+        commands.append((source, directory, args))
+    return commands
+
+def shardOf(source, shards):
+    # The same on every node, unlike hash()
+    return int(hashlib.sha1(source.encode()).hexdigest(), 16) % shards
+
+def bundleFilename(source):
+    return os.path.join(bundleDirectory, "units", hashlib.sha1(source.encode()).hexdigest()[:16] + ".facts")
+
+def manifestFilename(shard, shards):
+    return os.path.join(bundleDirectory, "shard-%d-of-%d.json" % (shard, shards))
+
+def unitKey(source, directory, args):
+    # What a bundle was made from: the source, the command it was dumped
+    # with and every setting that changes its copies or outputs. Headers
+    # aren't part of it, a bundle is as current as the source.
+    with open(source, "rb") as sourceFile:
+        content = sourceFile.read()
+    settings = [varToTrace, analyzedFiles, outputMode, elideInstrumentation, functionSummaries, aliasMode, runtimeCapacity, pchInUse]
+    return hashlib.sha1(json.dumps([hashlib.sha1(content).hexdigest(), directory, args] + settings).encode()).hexdigest()
+
+def writeAtomically(filename, write):
+    # Readers, and a node re-running the shard, see the whole file or none
+    temporary = filename + ".%d.tmp" % os.getpid()
+    write(temporary)
+    os.replace(temporary, filename)
+
+def runShard(commandsFilename, shard):
+    # Analyze the units of one shard into a bundle each: the facts of the
+    # unit with its copies and instrumented outputs in the header. Units
+    # whose bundle is still current are left alone, so a failed shard can
+    # simply be run again, on this node or another one.
+    global clangArgs
+    commands = [command for command in compileCommands(commandsFilename) if shardOf(command[0], shardCount) == shard]
+    os.makedirs(os.path.join(bundleDirectory, "units"), exist_ok=True)
+    workingDirectory = os.getcwd()
+    units = {}
+    for source, directory, args in commands:
+        bundle = bundleFilename(source)
+        try:
+            key = unitKey(source, directory, args)
+        except OSError as error:
+            units[source] = {"status": "failed", "reason": str(error)}
+            print("%s: %s" % (source, error))
+            continue
+        try:
+            facts = FactTable(bundle)
+            current = facts.header.get("key") == key
+            facts.close()
+        except (OSError, ValueError):
+            current = False
+        if current:
+            units[source] = {"status": "done", "bundle": os.path.relpath(bundle, bundleDirectory)}
+            print("%s: unchanged" % source)
+            continue
+
+        clangArgs = args
+        os.chdir(directory)
+        start = time.perf_counter()
+        try:
+            outputs, copies = analyzeTranslationUnit(source, None)
+        except Exception as error:
+            units[source] = {"status": "failed", "reason": "%s: %s" % (type(error).__name__, error)}
+            print("%s: %s" % (source, units[source]["reason"]))
+            continue
+        finally:
+            os.chdir(workingDirectory)
+        header = {"source": source, "key": key, "varToTraceId": Variable.varToTraceId, "memcpyId": FunctionDeclaration.memcpyId, "freeId": FunctionDeclaration.freeId,
+                  "analyzed": analyzedFiles or [source], "copies": copies, "outputs": outputs, "seconds": time.perf_counter() - start}
+        writeAtomically(bundle, lambda filename: FactTable.write(filename, header=header))
+        units[source] = {"status": "done", "bundle": os.path.relpath(bundle, bundleDirectory)}
+        print("%s: %d copies" % (source, len(copies)))
+
+    manifest = {"shard": shard, "shards": shardCount, "units": units}
+    def writeManifest(filename):
+        with open(filename, "w") as manifestFile:
+            json.dump(manifest, manifestFile, indent=1)
+    writeAtomically(manifestFilename(shard, shardCount), writeManifest)
+    failed = [source for source, unit in units.items() if unit["status"] != "done"]
+    print("shard %d of %d: %d units, %d failed" % (shard, shardCount, len(units), len(failed)))
+    return len(failed) == 0
+
+def mergeBundles():
+    # Load the bundles of every shard into one fact database, the global
+    # dependency graph, and trace the variable from each unit that has it
+    # across all of them. Shards missing or with failed units are reported,
+    # the rest is merged anyway. Writes the outputs of the bundles and the
+    # copies to merged.json in the bundle directory.
+    bundles = {}
+    for shard in range(shardCount):
+        try:
+            with open(manifestFilename(shard, shardCount)) as manifestFile:
+                manifest = json.load(manifestFile)
+        except OSError:
+            print("shard %d of %d hasn't finished, its units are missing" % (shard, shardCount))
+            continue
+        for source, unit in manifest["units"].items():
+            if unit["status"] == "done":
+                bundles[source] = os.path.join(bundleDirectory, unit["bundle"])
+            else:
+                print("%s failed in shard %d: %s" % (source, shard, unit["reason"]))
+
+    # Only the default database is merge's own to replace, main() refuses
+    # a --database that already exists
+    filename = databaseFilename or os.path.join(bundleDirectory, "merged.sqlite")
+    if databaseFilename is None and os.path.exists(filename):
+        os.remove(filename)
+    database = FactDatabase(filename)
+    traced = []
+    changed = 0
+    for source in sorted(bundles):
+        facts = FactTable(bundles[source])
+        tu = database.insertFactTable(source, facts, facts.header["analyzed"])
+        if facts.header["varToTraceId"] is not None:
+            traced.append((tu, source, facts.header["varToTraceId"]))
+        for outputFilename, data in facts.header["outputs"]:
+            changed += writeIfChanged(outputFilename, data)
+        facts.close()
+
+    sources = dict(database.connection.execute("SELECT tu, src FROM units"))
+    names = {(tu, id): name for tu, id, name in database.connection.execute("SELECT tu, id, name FROM vars")}
+    copies = {}
+    for tu, source, traceId in traced:
+        copies[source] = [(sources[copyTu], id, names.get((copyTu, intId(id)))) for copyTu, id in database.traceCopies(tu, traceId)]
+        for copySource, id, name in copies[source]:
+            print("%s: %s-%s" % (copySource, name, id))
+    database.close()
+    with open(os.path.join(bundleDirectory, "merged.json"), "w") as mergedFile:
+        json.dump({"units": sorted(bundles), "copies": copies}, mergedFile, indent=1)
+    print("%d translation units merged, %d traced, %d outputs changed" % (len(bundles), len(traced), changed))
+
+def main():
+    global srcFilename, varToTrace, analyzedFiles, lazyChildren, functionsToAnalyze, jsonBackend, frontend, clangArgs, runtimeCapacity, elideInstrumentation, shardWorkers, databaseFilename, functionSummaries, summaryCacheFilename, aliasMode, watchDebounce, findings, pipelineDepth, clangTimeout, dumpRetries, memoryLimit, historyFilename, headerCacheFilename, pchFilename, outputMode, bundleDirectory, shardCount, graphExportFilename, graphExportFormat, drawFilename, neighborhoodHops, neighborhoodCenter
+
+    parser = argparse.ArgumentParser(description="Trace the copies of a variable through a C/C++ file and instrument them")
+    parser.add_argument("command", nargs="?", default="analyze", choices=["analyze", "index", "benchmark-decode", "benchmark-frontends", "benchmark-runtime", "benchmark-overhead", "watch", "shard-run", "merge", "regress"])
+    parser.add_argument("--src", nargs="+", default=[srcFilename], help="File to analyze, several are pipelined into <file>_inst.<ext> each")
+    parser.add_argument("--trace", default=varToTrace, help="Name of the variable to trace")
+    parser.add_argument("--analyze-file", action="append", default=[], help="File whose flows are analyzed, can be repeated (defaults to --src)")
+    parser.add_argument("--lazy", action="store_true", help="Only build the function bodies that get analyzed")
+    parser.add_argument("--functions", nargs="+", help="Functions to analyze in --lazy mode")
+    parser.add_argument("--jobs", type=int, default=shardWorkers, help="Worker processes building the translation unit in shards")
+    parser.add_argument("--frontend", default=frontend, choices=["json", "libclang"])
+    parser.add_argument("--clang-arg", action="append", default=[], help="Extra argument for clang, can be repeated")
+    parser.add_argument("--json-backend", default=jsonBackend, choices=["auto", "orjson", "simdjson", "json"])
+    parser.add_argument("--dump", help="Clang JSON dump for benchmark-decode, --src is dumped if not given")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions for benchmarks")
+    parser.add_argument("--calls", type=int, default=10000000, help="Calls per case for benchmark-runtime")
+    parser.add_argument("--synthetic", type=int, action="append", default=[], help="Add a generated source with this many functions to benchmark-overhead, can be repeated")
+    parser.add_argument("--workload-arg", action="append", default=[], help="Argument for the binaries run by benchmark-overhead, can be repeated")
+    parser.add_argument("--workload-input", help="File fed to the standard input of the binaries run by benchmark-overhead")
+    parser.add_argument("--write-facts", help="Write the facts of --src to this fact table after ingestion")
+    parser.add_argument("--read-facts", help="Trace through the facts of this fact table instead of parsing --src, printing the copies")
+    parser.add_argument("--database", help="SQLite database to store the facts of --src in and trace through")
+    parser.add_argument("--summaries", action="store_true", help="Also stitch calls from per-function summaries of where the parameters flow, finding the flows out through return values and into other arguments")
+    parser.add_argument("--summary-cache", help="JSON file the function summaries are kept in across runs, by function content")
+    parser.add_argument("--alias-mode", default=aliasMode, choices=["directed", "unify"], help="Follow flows from --trace, or take its whole alias set as a fast conservative pass")
+    parser.add_argument("--debounce", type=float, default=watchDebounce * 1e3, help="Milliseconds watch waits for changes to settle before re-instrumenting")
+    parser.add_argument("--findings", help="Write the memcpy() edges, traced copies and checked free() calls to this file as each step finds them, - for stdout (other output then goes to stderr)")
+    parser.add_argument("--findings-format", choices=["jsonl", "sarif"], help="Format of --findings, SARIF for a .sarif file and JSON lines otherwise")
+    parser.add_argument("--queue-depth", type=int, default=pipelineDepth, help="Translation units waiting between two pipeline stages")
+    parser.add_argument("--timeout", type=float, help="Seconds clang may take to dump one translation unit")
+    parser.add_argument("--retries", type=int, default=dumpRetries, help="Retries of a dump that failed or timed out before its unit is skipped")
+    parser.add_argument("--memory-limit", type=int, help="MiB clang and the decoded dump of one translation unit may take")
+    parser.add_argument("--history", help="JSON file of how long each translation unit took, to schedule the next run largest first")
+    parser.add_argument("--header-cache", help="JSON file of the function declarations of headers, so their declarations aren't built again while unchanged")
+    parser.add_argument("--pch", help="Precompiled header of the include lines the sources start with when they only bring in system headers, built if missing or out of date and dumped with")
+    parser.add_argument("--output", default=outputMode, choices=["file", "diff", "edits"], help="Write the instrumented source, a unified diff against it or a JSON list of (byte offset, text) insertions")
+    parser.add_argument("--compile-commands", help="compile_commands.json whose translation units shard-run splits into --shards")
+    parser.add_argument("--shards", type=int, default=shardCount, help="Shards the units of --compile-commands are split into, by a hash of their path")
+    parser.add_argument("--shard", type=int, help="Shard shard-run analyzes, from 0")
+    parser.add_argument("--bundle-dir", help="Directory shared by the nodes, shard-run writes a bundle per unit there and merge combines them")
+    parser.add_argument("--export-graph", help="Write the edges of the dependency graph to this file as they're found")
+    parser.add_argument("--graph-format", choices=["csv", "npy", "graphml"], help="Format of --export-graph, by its extension if not given and CSV otherwise")
+    parser.add_argument("--draw", help="Draw the dependency graph into this image")
+    parser.add_argument("--hops", type=int, help="Only draw what's this many flows away from --center")
+    parser.add_argument("--center", help="Variable name or id the --hops neighborhood is around, or free:<line> for the free() call on that line (defaults to --trace)")
+    parser.add_argument("--update-golden", action="store_true", help="Make regress write the golden copies and instrumented sources of the corpus instead of checking them")
+    parser.add_argument("--no-elide", action="store_true", help="Keep every __AddAddress() call instead of dropping redundant ones")
+    parser.add_argument("--runtime-capacity", type=int, default=runtimeCapacity, help="Slots in the runtime's address set, a power of two")
+    args = parser.parse_args()
+    if args.command == "index" and args.database is None:
+        parser.error("index needs --database")
+    if args.command == "shard-run" and (args.compile_commands is None or args.shard is None or args.bundle_dir is None):
+        parser.error("shard-run needs --compile-commands, --shard and --bundle-dir")
+    if args.command == "merge" and args.bundle_dir is None:
+        parser.error("merge needs --bundle-dir")
+    if args.command == "merge" and args.database is not None and os.path.exists(args.database):
+        parser.error("merge builds --database from scratch and won't replace the existing " + args.database)
+    if args.shard is not None and not 0 <= args.shard < args.shards:
+        parser.error("--shard has to be below --shards")
+
+    srcFilename = args.src[0]
+    varToTrace = args.trace
+    analyzedFiles = args.analyze_file
+    lazyChildren = args.lazy
+    functionsToAnalyze = set(args.functions) if args.functions is not None else None
+    jsonBackend = args.json_backend
+    frontend = args.frontend
+    clangArgs = args.clang_arg
+    runtimeCapacity = args.runtime_capacity
+    elideInstrumentation = not args.no_elide
+    shardWorkers = args.jobs
+    databaseFilename = args.database
+    functionSummaries = args.summaries or args.summary_cache is not None
+    summaryCacheFilename = args.summary_cache
+    aliasMode = args.alias_mode
+    watchDebounce = args.debounce / 1e3
+    pipelineDepth = args.queue_depth
+    clangTimeout = args.timeout
+    dumpRetries = args.retries
+    memoryLimit = args.memory_limit
+    historyFilename = args.history
+    headerCacheFilename = args.header_cache
+    pchFilename = args.pch
+    outputMode = args.output
+    bundleDirectory = os.path.abspath(args.bundle_dir) if args.bundle_dir is not None else None
+    shardCount = args.shards
+    graphExportFilename = args.export_graph
+    graphExportFormat = args.graph_format
+    drawFilename = args.draw
+    neighborhoodHops = args.hops
+    neighborhoodCenter = args.center
+    if pchFilename is not None:
+        preparePch(args.src)
+
+    if args.command == "benchmark-decode":
+        benchmarkDecoders(args.dump, args.repeat)
+        return
+    if args.command == "benchmark-frontends":
+        benchmarkFrontends(args.repeat)
+        return
+    if args.command == "benchmark-runtime":
+        benchmarkRuntime(args.calls)
+        return
+    if args.command == "benchmark-overhead":
+        benchmarkOverhead(args.synthetic, args.workload_arg, args.workload_input, args.repeat)
+        return
+
+    if args.command == "watch":
+        watchSource()
+        return
+
+    if args.command == "regress":
+        if not regress(args.update_golden, args.repeat):
+            sys.exit(1)
+        return
+
+    if args.findings is not None:
+        findings = FindingsWriter(args.findings, args.findings_format)
+    try:
+        analyze(args)
+    finally:
+        if findings is not None:
+            findings.close()
+
+def analyze(args):
+    if args.command == "shard-run":
+        if not runShard(args.compile_commands, args.shard):
+            sys.exit(1)
+        return
+    if args.command == "merge":
+        mergeBundles()
+        return
+
+    if args.command == "analyze" and len(args.src) > 1:
+        asyncio.run(runPipeline(args.src))
+        return
+
+    if args.read_facts is not None:
+        # Without the AST there's nothing to instrument, and nothing needs
+        # the facts registered to trace through them
+        facts = FactTable(args.read_facts)
+        copies = facts.copies(facts.header.get("varToTraceId"))
+        for copyId, (name, file) in zip(copies, facts.describe(copies)):
+            if findings is not None:
+                findings.emit("traced-copy", str(name) + "." + copyId + " holds a copy of " + str(varToTrace), (file, None, None), variable=name, id=copyId)
+            print(str(name) + "." + copyId)
+        facts.close()
+        return
+
+    try:
+        nodeMap = climbAST()
+    except DumpFailed as error:
+        print("Couldn't dump %s" % error)
+        sys.exit(1)
+    if args.write_facts is not None:
+        FactTable.write(args.write_facts, header={"varToTraceId": Variable.varToTraceId, "memcpyId": FunctionDeclaration.memcpyId, "freeId": FunctionDeclaration.freeId, "analyzed": analyzedFiles or [srcFilename]})
+    if args.command == "index":
+        database = FactDatabase(databaseFilename)
+        database.insertTranslationUnit(srcFilename)
+        database.close()
+        return
+    if databaseFilename is not None:
+        database = FactDatabase(databaseFilename)
+        tu = database.insertTranslationUnit(srcFilename)
+        copies = database.traceCopies(tu, Variable.varToTraceId)
+        plan = database.planInstrumentation(tu, Variable.varToTraceId)
+        database.close()
+        reportCopies([id for copyTu, id in copies if copyTu == tu])
+        instrumentCode([id for copyTu, id in copies if copyTu == tu], plan)
+        return
+    allCopiesSet = findCopies()
+    reportCopies(allCopiesSet)
+    instrumentCode(allCopiesSet)
 
 if __name__ == "__main__":
-    nodeMap = climbAST()
-    allCopiesSet = buildDependencyGraph()
-    instrumentCode(allCopiesSet)
\ No newline at end of file
+    main()
\ No newline at end of file
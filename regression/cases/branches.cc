@@ -0,0 +1,45 @@
+#include <cstdio>
+#include <cstdlib>
+
+void wipe(char* W)
+{
+    W[0] = '\0';
+}
+
+void branches(int mode)
+{
+    char* X = (char*)malloc(32);
+    char* left;
+    char* right = NULL;
+    char* unrelated = (char*)malloc(32);
+    if(mode > 0) {
+        left = X;
+    }
+    else if(mode < 0) {
+        right = X;
+    }
+    else {
+        left = unrelated;
+    }
+
+    switch(mode) {
+        case 1: {
+            char* inCase = left;
+            wipe(inCase);
+            break;
+        }
+        case 2:
+            right = unrelated;
+            break;
+        default:
+            wipe(right);
+    }
+    free(X);
+    free(unrelated);
+}
+
+int main(int argc, char** argv)
+{
+    branches(argc);
+    return 0;
+}
@@ -0,0 +1,37 @@
+#include <cstdlib>
+#include <cstring>
+
+char* keep(char* P)
+{
+    char* kept = P;
+    return kept;
+}
+
+void deep(char* D)
+{
+    char* D_copy = (char*)malloc(16);
+    memcpy(D_copy, D, 16);
+    char* D_other = (char*)malloc(16);
+    memcpy(D_other, "not sensitive!!", 16);
+    free(D_copy);
+    free(D_other);
+}
+
+void copies()
+{
+    char* X = (char*)malloc(16);
+    char* X_a = X;
+    char* X_b;
+    char* X_c = X_b = X_a;
+    char* X_d;
+    X_d = X_c;
+    deep(X_b);
+    keep(X_d);
+    free(X);
+}
+
+int main(int argc, char** argv)
+{
+    copies();
+    return 0;
+}
@@ -0,0 +1,31 @@
+#include <cstdlib>
+
+char* sink;
+
+void loops(int n)
+{
+    char* X = (char*)malloc(64);
+    char* cursor = NULL;
+    int i;
+    for(i = 0; i < n; i++) {
+        cursor = X;
+        cursor[i] = 0;
+    }
+    while(n > 0) {
+        char* inWhile = cursor;
+        sink = inWhile;
+        n--;
+    }
+    do {
+        char* inDo;
+        inDo = sink;
+        inDo[0] = 1;
+    } while(n > 0);
+    free(X);
+}
+
+int main(int argc, char** argv)
+{
+    loops(argc);
+    return 0;
+}
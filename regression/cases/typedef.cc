@@ -0,0 +1,4 @@
+#include <cstdlib>
+typedef char* buf_t;
+char* g;
+void f(){ char* X=(char*)malloc(10); g=X; free(g);}
@@ -0,0 +1,279 @@
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+
+
+
+#include <stdint.h>
+#include <stdio.h>
+#include <string.h>
+#if defined(__GLIBC__) || defined(__linux__)
+#include <malloc.h>
+#define __AST_CLIMBER_BLOCK_SIZE(addr) malloc_usable_size(addr)
+#elif defined(__APPLE__)
+#include <malloc/malloc.h>
+#define __AST_CLIMBER_BLOCK_SIZE(addr) malloc_size(addr)
+#else
+#define __AST_CLIMBER_BLOCK_SIZE(addr) ((size_t)0)
+#endif
+
+#ifndef __AST_CLIMBER_CAPACITY
+#define __AST_CLIMBER_CAPACITY 65536
+#endif
+#define __AST_CLIMBER_TOMBSTONE ((void*)1)
+
+static void* __astClimberSlots[__AST_CLIMBER_CAPACITY];
+static void* __astClimberScratch[__AST_CLIMBER_CAPACITY];
+static size_t __astClimberLive;
+static size_t __astClimberUsed;
+static unsigned long __astClimberGeneration;
+static char __astClimberLock;
+static __thread void* __astClimberLastAdded;
+static __thread unsigned long __astClimberLastGeneration;
+
+static size_t __astClimberHash(void* addr) {
+    uint64_t h = (uint64_t)(uintptr_t)addr;
+    h ^= h >> 33;
+    h *= 0xff51afd7ed558ccdULL;
+    h ^= h >> 33;
+    return (size_t)h & (__AST_CLIMBER_CAPACITY - 1);
+}
+
+static void __astClimberAcquire(void) {
+    while (__atomic_test_and_set(&__astClimberLock, __ATOMIC_ACQUIRE)) {
+    }
+}
+
+static void __astClimberRelease(void) {
+    __atomic_clear(&__astClimberLock, __ATOMIC_RELEASE);
+}
+
+/* Rehashes the live entries to get rid of the tombstones, lock held */
+static void __astClimberPurge(void) {
+    size_t i;
+    memcpy(__astClimberScratch, __astClimberSlots, sizeof(__astClimberSlots));
+    memset(__astClimberSlots, 0, sizeof(__astClimberSlots));
+    for (i = 0; i < __AST_CLIMBER_CAPACITY; i++) {
+        void* addr = __astClimberScratch[i];
+        if (addr != NULL && addr != __AST_CLIMBER_TOMBSTONE) {
+            size_t slot = __astClimberHash(addr);
+            while (__astClimberSlots[slot] != NULL) {
+                slot = (slot + 1) & (__AST_CLIMBER_CAPACITY - 1);
+            }
+            __astClimberSlots[slot] = addr;
+        }
+    }
+    __astClimberUsed = __astClimberLive;
+}
+
+__attribute__((weak)) void __AddAddress(void* addr) {
+    size_t slot;
+    size_t firstFree = (size_t)-1;
+    unsigned long generation = __atomic_load_n(&__astClimberGeneration, __ATOMIC_ACQUIRE);
+    if (addr == NULL || (addr == __astClimberLastAdded && generation == __astClimberLastGeneration)) {
+        return;
+    }
+
+    __astClimberAcquire();
+    if (__astClimberUsed >= __AST_CLIMBER_CAPACITY / 4 * 3) {
+        __astClimberPurge();
+    }
+    for (slot = __astClimberHash(addr); __astClimberSlots[slot] != NULL; slot = (slot + 1) & (__AST_CLIMBER_CAPACITY - 1)) {
+        if (__astClimberSlots[slot] == addr) {
+            firstFree = slot;
+            break;
+        }
+        if (__astClimberSlots[slot] == __AST_CLIMBER_TOMBSTONE && firstFree == (size_t)-1) {
+            firstFree = slot;
+        }
+    }
+    if (firstFree == (size_t)-1 || __astClimberSlots[firstFree] != addr) {
+        if (__astClimberLive >= __AST_CLIMBER_CAPACITY / 4 * 3) {
+            __astClimberRelease();
+            fprintf(stderr, "__AddAddress: address set is full, raise __AST_CLIMBER_CAPACITY\n");
+            return;
+        }
+        if (firstFree == (size_t)-1) {
+            firstFree = slot;
+            __astClimberUsed++;
+        }
+        __astClimberSlots[firstFree] = addr;
+        __astClimberLive++;
+    }
+    __astClimberRelease();
+
+    __astClimberLastAdded = addr;
+    __astClimberLastGeneration = generation;
+}
+
+__attribute__((weak)) void __MemoryWipingCheck(void* addr) {
+    size_t slot;
+    size_t size;
+    size_t i;
+    int registered = 0;
+    const unsigned char* bytes = (const unsigned char*)addr;
+    if (addr == NULL) {
+        return;
+    }
+
+    __astClimberAcquire();
+    for (slot = __astClimberHash(addr); __astClimberSlots[slot] != NULL; slot = (slot + 1) & (__AST_CLIMBER_CAPACITY - 1)) {
+        if (__astClimberSlots[slot] == addr) {
+            __astClimberSlots[slot] = __AST_CLIMBER_TOMBSTONE;
+            __astClimberLive--;
+            __atomic_add_fetch(&__astClimberGeneration, 1, __ATOMIC_RELEASE);
+            registered = 1;
+            break;
+        }
+    }
+    __astClimberRelease();
+    if (!registered) {
+        return;
+    }
+
+    /* malloc() hands out blocks aligned for any word, so no unaligned head */
+    size = __AST_CLIMBER_BLOCK_SIZE(addr);
+    for (i = 0; i + sizeof(uintptr_t) <= size; i += sizeof(uintptr_t)) {
+        uintptr_t word;
+        memcpy(&word, bytes + i, sizeof(word));
+        if (word != 0) {
+            break;
+        }
+    }
+    for (; i < size; i++) {
+        if (bytes[i] != 0) {
+            fprintf(stderr, "__MemoryWipingCheck: %p is freed without being wiped (byte %lu of %lu is set)\n", addr, (unsigned long)i, (unsigned long)size);
+            return;
+        }
+    }
+}
+
+#ifdef __AST_CLIMBER_PROFILE
+/* Count the hits of every call written after this point. A site is the n-th
+   such call, numbered in the order instrumentCode() returns them */
+#include <stdlib.h>
+#define __AST_CLIMBER_SITES 7
+enum { __astClimberSiteBase = __COUNTER__ + 1 };
+static unsigned long __astClimberSiteHits[__AST_CLIMBER_SITES + 1];
+
+static void __astClimberDumpProfile(void) {
+    const char* path = getenv("AST_CLIMBER_PROFILE");
+    FILE* out = path != NULL ? fopen(path, "w") : stderr;
+    int site;
+    if (out == NULL) {
+        return;
+    }
+    for (site = 0; site < __AST_CLIMBER_SITES; site++) {
+        fprintf(out, "%d %lu\n", site, __atomic_load_n(&__astClimberSiteHits[site], __ATOMIC_RELAXED));
+    }
+    if (out != stderr) {
+        fclose(out);
+    }
+}
+
+static void __attribute__((constructor)) __astClimberRegisterProfile(void) {
+    atexit(__astClimberDumpProfile);
+}
+
+static inline int __astClimberHit(int site) {
+    /* Sites past the known ones all land in the spare last slot */
+    if (site < 0 || site > __AST_CLIMBER_SITES) {
+        site = __AST_CLIMBER_SITES;
+    }
+    __atomic_fetch_add(&__astClimberSiteHits[site], 1, __ATOMIC_RELAXED);
+    return 0;
+}
+
+/* A macro doesn't expand inside itself, so these still call the functions */
+#define __AddAddress(addr) (__astClimberHit(__COUNTER__ - __astClimberSiteBase), __AddAddress(addr))
+#define __MemoryWipingCheck(addr) (__astClimberHit(__COUNTER__ - __astClimberSiteBase), __MemoryWipingCheck(addr))
+#endif
+
+char * globalVar;
+
+void zero_out_memory(char* G)
+{
+    int i;
+    for(i = 0; i < 100; i++)
+    {
+        G[i] = '\0';
+    }
+}
+
+void copy_process(char* Y) {
+    char* Y_deepcp = (char*)malloc(100*sizeof(char));
+                __AddAddress(Y_deepcp) /* Initialization */ ;
+    memcpy(Y_deepcp, Y, 100*sizeof(char));
+    char* other = (char*)malloc(99*sizeof(char));
+    strcpy(other, "Non-sensitive data");
+    __MemoryWipingCheck(Y_deepcp); /* Called free() */ 
+free(Y_deepcp);
+    free(other);
+}
+
+void CWE244_dummy()
+{
+    char* X = (char*)malloc(100*sizeof(char));
+                __AddAddress(X) /* Initialization */ ;
+    char* X_shallowcp = X;
+                __AddAddress(X_shallowcp) /* Initialization */ ;
+    char* X_shallowcp2;
+    char* X_shallowcp3 = X_shallowcp2 = X;
+                __AddAddress(X_shallowcp3) /* Initialization */ ;
+                __AddAddress(X_shallowcp2) /* Assignment */ ;
+    if(fgets(X, 100, stdin) == NULL) {
+        printf("fgets() failed");
+        X[0] = '\0';
+    }
+    
+    copy_process(X_shallowcp);
+    zero_out_memory(X);
+    __MemoryWipingCheck(X); /* Called free() */ 
+free(X);
+}
+
+int add(int a, int b, int c)
+{
+    return a+b+c;
+}
+
+
+int main(int argc, char** argv){
+    globalVar = (char*)malloc(100*sizeof(char));
+    CWE244_dummy();
+    free(globalVar);
+    int d = 0;
+    int e = 0;
+    int f = 0;
+    if(add(d,2,f))
+    {
+        d = e;
+    }
+    else
+    {
+        d = f;
+    }
+
+    while(add(d,e,f))
+    {
+        d = 0;
+    }
+
+    do {
+        e = 0;
+    } while (add(d,e,f));
+
+    for(d = 0; d < add(d,e,f); d++)
+    {
+        f = 0;
+    }
+
+    switch(add(d,e,f))
+    {
+        case 0: break;
+        case 1: break;
+        default: break;
+    }
+
+    return 0;
+}
\ No newline at end of file